@@ -0,0 +1,140 @@
+# pylint: disable=invalid-name
+# pylint: disable=line-too-long
+"""asyncio front end for IO.
+
+AsyncIO runs every call of one IO on its own worker thread, in submission
+order, so the event loop stays free for BER computation, result files or a
+status UI while the adapter is busy.  Any IO method can be awaited, and
+generator methods such as read_pages_cached become async iterators:
+
+    dev = await AsyncIO.open(simulation_mode = True)
+    data = await dev.read_page(0)
+    async for pageno, page in dev.read_pages_cached(0, 63):
+        await asyncio.to_thread(analyse, pageno, page)
+    await dev.close()
+
+At most queue_size calls wait for the worker; further submissions wait for
+a free slot.  An iteration holds the worker until it ends (a cache read must
+not be interleaved with other commands) and reads at most prefetch pages
+ahead of the consumer.  Attributes such as PageSize are read directly.
+Host work overlaps transfers as long as it releases the GIL (file and
+network I/O, NumPy); long pure-Python loops belong in a process pool.
+"""
+import asyncio
+import functools
+import inspect
+import queue
+import threading
+from flashdevice import IO
+
+_DONE = object()
+
+class AsyncIO:
+    def __init__(self, nand, queue_size = 8, prefetch = 4):
+        self.nand = nand
+        self.prefetch = prefetch
+        self.slots = asyncio.Semaphore(queue_size)
+        self.work = queue.Queue()
+        self.worker = threading.Thread(target = self.__run, daemon = True)
+        self.worker.start()
+
+    @classmethod
+    async def open(cls, queue_size = 8, prefetch = 4, **io_args):
+        """Constructs the IO (identification included) off the event loop."""
+        return cls(await asyncio.to_thread(IO, **io_args), queue_size, prefetch)
+
+    def __run(self):
+        while True:
+            item = self.work.get()
+            if item is None:
+                return
+            loop, future, func = item
+            try:
+                result = func()
+            except BaseException as error:
+                loop.call_soon_threadsafe(_resolve, future, None, error)
+            else:
+                loop.call_soon_threadsafe(_resolve, future, result, None)
+
+    async def call(self, func, *args, **kwargs):
+        """Runs func(*args, **kwargs) on the worker thread and returns its result."""
+        loop = asyncio.get_running_loop()
+        async with self.slots:
+            future = loop.create_future()
+            self.work.put((loop, future, functools.partial(func, *args, **kwargs)))
+            return await future
+
+    async def iterate(self, func, *args, **kwargs):
+        """Iterates the generator func(*args, **kwargs) on the worker thread."""
+        loop = asyncio.get_running_loop()
+        # a thread queue, so the worker only waits for the event loop when it is prefetch items ahead
+        items = queue.Queue(maxsize = self.prefetch)
+        ready = asyncio.Event()
+        stop = threading.Event()
+
+        def produce():
+            generator = func(*args, **kwargs)
+            try:
+                for item in generator:
+                    items.put(item)
+                    loop.call_soon_threadsafe(ready.set)
+                    if stop.is_set():
+                        return
+            finally:
+                generator.close()
+                if not stop.is_set():
+                    items.put(_DONE)
+                    loop.call_soon_threadsafe(ready.set)
+
+        done = asyncio.ensure_future(self.call(produce))
+        try:
+            while True:
+                try:
+                    item = items.get_nowait()
+                except queue.Empty:
+                    ready.clear()
+                    if items.empty():
+                        await ready.wait()
+                    continue
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            stop.set()
+            # a producer blocked on the full queue needs one free slot to see the stop
+            while True:
+                try:
+                    items.get_nowait()
+                except queue.Empty:
+                    break
+            await asyncio.wait([done])
+            error = done.exception()
+        if error is not None:
+            raise error
+
+    def __getattr__(self, name):
+        attribute = getattr(self.nand, name)
+        if not callable(attribute):
+            return attribute
+        if inspect.isgeneratorfunction(attribute):
+            return functools.partial(self.iterate, attribute)
+        return functools.partial(self.call, attribute)
+
+    async def close(self):
+        """Lets queued calls finish and stops the worker thread."""
+        self.work.put(None)
+        await asyncio.to_thread(self.worker.join)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+def _resolve(future, result, error):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
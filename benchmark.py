@@ -0,0 +1,653 @@
+# pylint: disable=invalid-name
+# pylint: disable=line-too-long
+"""Host-side micro-benchmarks.
+
+Usage: python benchmark.py [name ...]     (no names runs everything)
+
+Every reported time is kept under "<benchmark>: <name>".  --save stores them
+as a JSON baseline (default BASELINE), --compare checks a run against one and
+exits with status 1 when a result is more than --threshold slower:
+
+    python benchmark.py --save                 # on the reference commit
+    python benchmark.py --compare              # later, same machine
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+import flashdevice_defs
+import mpsse
+import nandsim
+import utils
+
+# FT2232H high speed bulk transfers complete on 125 us microframes
+USB_LATENCY = 125e-6
+
+BENCHMARKS = {}
+
+BASELINE = 'benchmark_baseline.json'
+# slowdown against the baseline reported as a regression, as a fraction
+THRESHOLD = 0.25
+# results below this many seconds are too noisy to compare
+MIN_COMPARED = 20e-6
+
+# "<benchmark>: <name>" -> seconds of the current run, filled by report()
+RESULTS = {}
+_current = None
+
+def benchmark(func):
+    BENCHMARKS[func.__name__[len('bench_'):]] = func
+    return func
+
+def best_of(func, number, repeat = 5):
+    """Returns the best per-call time in seconds."""
+    return min(timeit.repeat(func, number = number, repeat = repeat)) / number
+
+def timed(func):
+    """Returns the wall clock time of one call."""
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+def simulated_io(latency = USB_LATENCY, bytes_per_second = 0.0, **model_args):
+    """Returns an IO instance on a simulated chip with USB round trip cost."""
+    from flashdevice import IO
+    model_args.setdefault('page_size', 2048)
+    model_args.setdefault('oob_size', 64)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return IO(transport = nandsim.SimulatedFtdi(nandsim.NandModel(**model_args), latency = latency, bytes_per_second = bytes_per_second))
+
+def report(name, seconds, nbytes = 0):
+    RESULTS[f"{_current}: {name}"] = seconds
+    line = f"{name:<44} {seconds*1e6:12.1f} us"
+    if nbytes:
+        line += f" {nbytes/seconds/1e6:10.2f} MB/s"
+    print(line)
+
+# The per-byte list encoders IO used before mpsse.py, kept as the baseline
+def legacy_encode_read(cmd_type, count):
+    cmds = [flashdevice_defs.MPSSE_READ_EXTENDED, cmd_type, 0]
+    for _ in range(1, count, 1):
+        cmds += [flashdevice_defs.MPSSE_READ_SHORT, 0]
+    cmds.append(flashdevice_defs.MPSSE_SEND_IMMEDIATE)
+    return bytes(cmds)
+
+def legacy_encode_write(cmd_type, data):
+    cmds = [flashdevice_defs.MPSSE_WRITE_EXTENDED, cmd_type, 0, ord(data[0])]
+    for i in range(1, len(data), 1):
+        cmds += [flashdevice_defs.MPSSE_WRITE_SHORT, 0, ord(data[i])]
+    return bytes(cmds)
+
+@benchmark
+def bench_encode():
+    """MPSSE command encoding of one 16 KiB + 1216 B page."""
+    count = 16384 + 1216
+    payload = os.urandom(count)
+    payload_str = payload.decode('latin-1')
+    ct = mpsse.cmd_type(0, 0, True)
+
+    assert legacy_encode_read(0, count) == mpsse.encode_read(0, count)
+    assert legacy_encode_write(ct, payload_str) == mpsse.encode_write(ct, payload)
+
+    legacy_read = best_of(lambda: legacy_encode_read(0, count), 5)
+    cached_read = best_of(lambda: mpsse.encode_read(0, count), 1000)
+    legacy_write = best_of(lambda: legacy_encode_write(ct, payload_str), 5)
+    cached_write = best_of(lambda: mpsse.encode_write(ct, payload), 1000)
+
+    report("encode read (legacy list)", legacy_read, count)
+    report("encode read (mpsse template)", cached_read, count)
+    report("encode write (legacy list)", legacy_write, count)
+    report("encode write (mpsse template)", cached_write, count)
+    print(f"speedup: read x{legacy_read/cached_read:.0f}, write x{legacy_write/cached_write:.0f}")
+
+@benchmark
+def bench_bytewise():
+    """read_page_bytewise window sizes on a simulated 2 KiB page, 125 us USB latency."""
+    nand = simulated_io()
+    payload = os.urandom(nand.PageSize)
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        nand.write_page(0, payload)
+        for window in (1, 16, 0x200, 0x1000):
+            assert bytes(nand.read_page_bytewise(0, window = window)[:nand.PageSize]) == payload
+            results.append((f"read_page_bytewise window={window}", timed(lambda: nand.read_page_bytewise(0, window = window))))
+        results.append(("read_page read_chunk=0x1000", timed(lambda: nand.read_page(0))))
+
+    for name, seconds in results:
+        report(name, seconds, nand.RawPageSize)
+
+@benchmark
+def bench_read_chunk():
+    """read_page of a simulated 2 KiB + 64 B page at each read_chunk, 125 us USB latency."""
+    nand = simulated_io()
+    nand.Progress = None
+    for read_chunk in (0x1, 0x10, 0x100, 0x1000):
+        seconds = timed(lambda: nand.read_page(0, read_chunk)) if read_chunk < 0x100 else best_of(lambda: nand.read_page(0, read_chunk), 5)
+        report(f"read_page read_chunk=0x{read_chunk:x}", seconds, nand.RawPageSize)
+
+@benchmark
+def bench_operations():
+    """Erase / program / read latency and USB calls per operation on a simulated chip."""
+    nand = simulated_io(t_r = 60e-6, t_prog = 600e-6, t_bers = 3e-3)
+    sim = nand.ftdi
+    payload = os.urandom(nand.PageSize)
+    operations = (("erase", lambda: nand.erase_block_by_page(0)),
+                  ("program", lambda: nand.write_page(0, payload)),
+                  ("read", lambda: nand.read_page(0, read_chunk = nand.RawPageSize)))
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for wait_on_io in (False, True):
+            nand.WaitOnIO = wait_on_io
+            for name, operation in operations:
+                calls = sim.writes + sim.reads
+                seconds = timed(operation)
+                results.append((f"{name} WaitOnIO={wait_on_io} ({sim.writes + sim.reads - calls} USB calls)", seconds))
+
+    for name, seconds in results:
+        report(name, seconds)
+
+@benchmark
+def bench_sequential_read():
+    """64 sequential pages across a LUN boundary: read_page loop vs cache read, simulated tR = 200 us, 8 MB/s bus."""
+    nand = simulated_io(bytes_per_second = 8e6, luns = 2, blocks_per_lun = 2, pages_per_block = 32, t_r = 200e-6, t_rcbsy = 3e-6)
+    pages = range(nand.BlockPerLUN * nand.PagePerBlock - 32, nand.BlockPerLUN * nand.PagePerBlock + 32)
+    payload = {pageno: os.urandom(nand.PageSize) + b'\xff' * nand.OOBSize for pageno in pages}
+    nbytes = len(pages) * nand.RawPageSize
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for pageno, data in payload.items():
+            nand.write_page(pageno, data)
+        for wait_on_io in (False, True):
+            nand.WaitOnIO = wait_on_io
+            results.append((f"read_page loop WaitOnIO={wait_on_io}", timed(lambda: [nand.read_page(pageno, nand.RawPageSize) for pageno in pages])))
+            results.append((f"read_pages_cached WaitOnIO={wait_on_io}", timed(lambda: list(nand.read_pages_cached(pages[0], pages[-1])))))
+            # READ CACHE RANDOM must not cross into the next LUN
+            assert dict(nand.read_pages_cached(pages[0], pages[-1])) == payload
+
+    for name, seconds in results:
+        report(name, seconds, nbytes)
+
+@benchmark
+def bench_row_address():
+    """Whole 2-LUN part with 6 blocks of 6 pages per LUN, so the row fields are rounded up to powers of two: read_page loop vs cache read, checked against the data programmed and after erasing one block of LUN 1."""
+    nand = simulated_io(bytes_per_second = 30e6, luns = 2, blocks_per_lun = 6, pages_per_block = 6, t_r = 50e-6)
+    payload = {pageno: os.urandom(nand.PageSize) + b'\xff' * nand.OOBSize for pageno in range(nand.PageCount)}
+    nbytes = nand.PageCount * nand.RawPageSize
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for pageno, data in payload.items():
+            nand.write_page(pageno, data)
+        for wait_on_io in (False, True):
+            nand.WaitOnIO = wait_on_io
+            results.append((f"read_page loop WaitOnIO={wait_on_io}", timed(lambda: [nand.read_page(pageno, nand.RawPageSize) for pageno in payload])))
+            assert {pageno: bytes(nand.read_page(pageno, nand.RawPageSize)) for pageno in payload} == payload
+            results.append((f"read_pages_cached WaitOnIO={wait_on_io}", timed(lambda: list(nand.read_pages_cached(0, nand.PageCount - 1)))))
+            assert dict(nand.read_pages_cached(0, nand.PageCount - 1)) == payload
+        block = nand.BlockPerLUN + 4
+        nand.erase_block_by_page(block * nand.PagePerBlock)
+        erased = range(block * nand.PagePerBlock, (block + 1) * nand.PagePerBlock)
+        assert all((data == b'\xff' * nand.RawPageSize) == (pageno in erased) for pageno, data in nand.read_pages_cached(0, nand.PageCount - 1))
+
+    for name, seconds in results:
+        report(name, seconds, nbytes)
+
+@benchmark
+def bench_cache_program():
+    """Programming a 64 page block: write_page loop vs cache program, simulated tPROG = 600 us, 8 MB/s bus."""
+    nand = simulated_io(bytes_per_second = 8e6, t_prog = 600e-6, t_cbsy = 3e-6)
+    pages = [os.urandom(nand.RawPageSize) for _ in range(nand.PagePerBlock)]
+    nbytes = len(pages) * nand.RawPageSize
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for wait_on_io in (False, True):
+            nand.WaitOnIO = wait_on_io
+            nand.erase_block_by_page(0)
+            results.append((f"write_page loop WaitOnIO={wait_on_io}", timed(lambda: [nand.write_page(pageno, page) for pageno, page in enumerate(pages)])))
+            nand.erase_block_by_page(0)
+            results.append((f"write_pages_cached WaitOnIO={wait_on_io}", timed(lambda: nand.write_pages_cached(0, pages))))
+
+    for name, seconds in results:
+        report(name, seconds, nbytes)
+
+@benchmark
+def bench_multi_plane():
+    """Erase + program 4 blocks on a simulated 2-plane MLC-like chip, tPROG = 1.5 ms, tBERS = 5 ms, 30 MB/s bus."""
+    nand = simulated_io(bytes_per_second = 30e6, planes = 2, pages_per_block = 32, t_prog = 1.5e-3, t_bers = 5e-3, t_cbsy = 3e-6, t_dbsy = 1e-6)
+    payload = os.urandom(nand.PageSize)
+    blocks = range(4, 8)
+    nbytes = len(blocks) * nand.PagePerBlock * nand.PageSize
+
+    def single_plane():
+        for block in blocks:
+            nand.erase_block_by_page(block * nand.PagePerBlock)
+            for pageno in range(nand.PagePerBlock):
+                nand.write_page_in_a_block(pageno, block, payload)
+
+    def multi_plane():
+        nand.erase_blocks(blocks[0], blocks[-1])
+        nand.write_all_pages_in_blocks(blocks, payload)
+
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for wait_on_io in (False, True):
+            nand.WaitOnIO = wait_on_io
+            results.append((f"single plane WaitOnIO={wait_on_io}", timed(single_plane)))
+            results.append((f"multi-plane groups WaitOnIO={wait_on_io}", timed(multi_plane)))
+
+    for name, seconds in results:
+        report(name, seconds, nbytes)
+
+@benchmark
+def bench_lun_interleave():
+    """Erase, program and read back 16 pages per LUN: blocking loop vs LunScheduler, tPROG = 600 us, tR = 60 us, 30 MB/s bus."""
+    from scheduler import LunScheduler
+    pages_per_lun = 16
+    payload = os.urandom(2048 + 64)
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for luns in (1, 2, 4):
+            nand = simulated_io(bytes_per_second = 30e6, luns = luns, blocks_per_lun = 64, pages_per_block = 32, t_r = 60e-6, t_prog = 600e-6, t_bers = 3e-3)
+            blocks = [lun * nand.BlockPerLUN for lun in range(luns)]
+            # round robin over the LUNs, the order a striped dump or endurance run uses
+            pagenos = [block * nand.PagePerBlock + offset for offset in range(pages_per_lun) for block in blocks]
+            nbytes = 2 * len(pagenos) * nand.RawPageSize
+
+            def blocking():
+                for block in blocks:
+                    nand.erase_block_by_page(block * nand.PagePerBlock)
+                for pageno in pagenos:
+                    nand.write_page(pageno, payload)
+                for pageno in pagenos:
+                    nand.read_page(pageno, nand.RawPageSize)
+
+            def scheduled():
+                sched = LunScheduler(nand)
+                for block in blocks:
+                    sched.erase(block)
+                for pageno in pagenos:
+                    sched.program(pageno, payload)
+                sched.run()
+                tickets = [sched.read(pageno) for pageno in pagenos]
+                data = sched.run()
+                assert all(bytes(data[ticket]) == payload for ticket in tickets)
+
+            results.append((f"blocking loop, {luns} LUN(s)", timed(blocking), nbytes))
+            results.append((f"LunScheduler, {luns} LUN(s)", timed(scheduled), nbytes))
+
+    for name, seconds, nbytes in results:
+        report(name, seconds, nbytes)
+
+def legacy_compute_ber(data1, data2):
+    # the per-byte loop utils.compute_ber used before ber.py
+    bits = 0
+    for idx, each_byte in enumerate(data1):
+        if each_byte != data2[idx]:
+            bits += utils.count_number_of_1s(each_byte ^ data2[idx])
+    return bits
+
+@benchmark
+def bench_ber():
+    """Bit error count of a 1 MiB comparison at BER 1e-3: per-byte loop vs ber.compare, and ber.compare on a 256 MiB memory-mapped file."""
+    import tempfile
+    import numpy as np
+    import ber
+    size = 1 << 20
+    rng = np.random.default_rng(0)
+    expected = rng.integers(0, 256, size = size, dtype = np.uint8)
+    actual = expected ^ (rng.random(size * 8) < 1e-3).astype(np.uint8).reshape(-1, 8).dot(1 << np.arange(8)).astype(np.uint8)
+    assert legacy_compute_ber(expected.tobytes(), actual.tobytes()) == ber.compare(expected, actual).bits
+
+    report("per-byte loop, 1 MiB", timed(lambda: legacy_compute_ber(expected.tobytes(), actual.tobytes())), size)
+    report("ber.compare, 1 MiB", best_of(lambda: ber.compare(expected, actual, 2112), 10), size)
+
+    big = 256 << 20
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [os.path.join(directory, name) for name in ('expected.bin', 'actual.bin')]
+        for path, pattern in zip(paths, (expected, actual)):
+            np.tile(pattern, big // size).tofile(path)
+        report("ber.compare, 256 MiB files (page_size 2112)", timed(lambda: ber.compare(paths[0], paths[1], 2112)), big)
+
+# utils.compute_ber input sizes; --large adds LARGE_COMPUTE_BER_SIZES
+COMPUTE_BER_SIZES = [1 << 20, 64 << 20]
+LARGE_COMPUTE_BER_SIZES = [1 << 30]
+
+@benchmark
+def bench_compute_ber():
+    """utils.compute_ber of two binary files at BER 1e-3, 1 MiB and 64 MiB (1 GiB with --large)."""
+    import tempfile
+    import numpy as np
+    rng = np.random.default_rng(0)
+    pattern = rng.integers(0, 256, size = 1 << 20, dtype = np.uint8)
+    flipped = pattern ^ (rng.random(len(pattern)) < 8e-3).astype(np.uint8)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [os.path.join(directory, name) for name in ('expected.bin', 'actual.bin')]
+        for size in COMPUTE_BER_SIZES:
+            for path, data in zip(paths, (pattern, flipped)):
+                with open(path, 'wb') as fd:
+                    for _ in range(size // len(data)):
+                        data.tofile(fd)
+            with contextlib.redirect_stdout(io.StringIO()):
+                seconds = best_of(lambda: utils.compute_ber(paths[0], True, paths[1], True, 2112), 1, repeat = 3)
+            report(f"compute_ber {size >> 20} MiB", seconds, size)
+
+@benchmark
+def bench_endurance():
+    """4 blocks of 16 pages x 5 P/E cycles with read-back into a ResultStore on a network share (20 ms per append): BER, results and checkpoint inline vs on the worker thread, tPROG = 600 us, tBERS = 3 ms, 30 MB/s bus."""
+    import tempfile
+    from endurance import EnduranceRun
+    from resultstore import ResultStore
+
+    class RemoteStore(ResultStore):
+        # every append waits for the file server
+        def append(self, *args):
+            time.sleep(20e-3)
+            super().append(*args)
+
+    nand = simulated_io(bytes_per_second = 30e6, page_size = 8192, oob_size = 448, pages_per_block = 16, t_r = 60e-6, t_prog = 600e-6, t_bers = 3e-3, t_cbsy = 3e-6, t_rcbsy = 3e-6)
+    nbytes = 4 * 5 * nand.PagePerBlock * nand.PageSize * 2
+    results = []
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        for pipeline in (False, True):
+            name = os.path.join(directory, f"pipeline{pipeline}")
+            run = EnduranceRun(nand, range(4), 5, name, pipeline = pipeline, store = RemoteStore(name + '.store'))
+            results.append((f"EnduranceRun pipeline={pipeline}", timed(run.run)))
+
+    for name, seconds in results:
+        report(name, seconds, nbytes)
+
+@benchmark
+def bench_result_store():
+    """One block across cycles 0-99 out of 16 blocks x 200 cycles x 128 pages: CSV re-parse vs ResultStore.select."""
+    import csv
+    import tempfile
+    import numpy as np
+    from resultstore import ResultStore
+    blocks, cycles, pages = 16, 200, 128
+    rng = np.random.default_rng(0)
+    bits = rng.poisson(20, size = (cycles, blocks, pages))
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, 'results.csv')
+        store = ResultStore(os.path.join(directory, 'store'))
+        with open(csv_path, 'w') as results:
+            for cycle in range(cycles):
+                for block in range(blocks):
+                    results.writelines(f"{block},{cycle},{page},{bits[cycle, block, page]}\n" for page in range(pages))
+                    store.append_block('chip', block, cycle, 'random', bits[cycle, block], 8 * 8192)
+
+        def parse_csv():
+            with open(csv_path) as results:
+                return [int(row[3]) for row in csv.reader(results) if int(row[0]) == 12 and int(row[1]) <= 99]
+
+        assert parse_csv() == store.select(block = 12, cycles = (0, 99))['bits'].tolist()
+        report("csv.reader re-parse", timed(parse_csv))
+        report("ResultStore.select", best_of(lambda: store.select(block = 12, cycles = (0, 99), columns = ('page', 'bits')), 10))
+
+@benchmark
+def bench_features():
+    """SET/GET FEATURES per call, 125 us USB round trip: new value, unchanged value (shadowed), and read back from the chip vs the shadow (was >= 50 ms each)."""
+    nand = simulated_io(t_feat = 1e-6)
+    values = [[1, 1, 0, 0], [2, 1, 0, 0]]
+    toggle = iter(range(1 << 30))
+
+    def get_uncached():
+        nand.invalidate_features(0x91)
+        return nand.get_features(0x91)
+
+    report("set_features, new value", best_of(lambda: nand.set_features(0x91, values[next(toggle) & 1]), 100))
+    report("set_features, same value", best_of(lambda: nand.set_features(0x91, values[0]), 100))
+    report("get_features from the chip", best_of(get_uncached, 100))
+    report("get_features from the shadow", best_of(lambda: nand.get_features(0x91), 100))
+
+@benchmark
+def bench_timing_modes():
+    """Cache read of 64 x 2 KiB pages per ONFI timing mode and FTDI clock, 30 MB/s bus at 60 MHz, tRC bound per mode."""
+    nand = simulated_io(bytes_per_second = 30e6, t_r = 25e-6, t_rcbsy = 3e-6)
+    count = 64
+    nbytes = count * nand.RawPageSize
+
+    def read_pages():
+        for _ in nand.read_pages_cached(0, count - 1):
+            pass
+
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for mode, slow in [(0, True)] + [(mode, False) for mode in range(nand.TimingModes.bit_length()) if nand.TimingModes & (1 << mode)]:
+            assert nand.set_timing_mode(mode, slow)
+            results.append((f"timing mode {mode}, {12 if slow else 60} MHz", timed(read_pages)))
+        nand.select_timing_mode()
+
+    for name, seconds in results:
+        report(name, seconds, nbytes)
+
+@benchmark
+def bench_vth_sweep():
+    """Read offset sweep of one 32 page block, time per level, tR = 50 us, 30 MB/s bus: set_features + read_page vs VthSweep,
+    also on every other page of the block, where the default configuration (no WaitOnIO) cannot cache read."""
+    from vthsweep import VthSweep, signed_p1
+    nand = simulated_io(bytes_per_second = 30e6, pages_per_block = 32, t_r = 50e-6, read_offset_feature = 0x89, read_offset_error_rate = 1e-4)
+    pagenos = list(range(nand.PagePerBlock))
+    nbytes = len(pagenos) * nand.PageSize
+
+    def per_page(levels):
+        # what a sweep built on the existing calls costs
+        for level in levels:
+            nand.set_features(0x89, signed_p1(level))
+            for pageno in pagenos:
+                nand.read_page(pageno, nand.PageSize, remove_oob = True)
+
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        results.append(("set_features + read_page", timed(lambda: per_page(range(3))) / 3, nbytes))
+        # WaitOnIO=False is the default configuration
+        for wait_on_io in (False, True):
+            nand.WaitOnIO = wait_on_io
+            sweep = VthSweep(nand, 0x89, range(-50, 50))
+            results.append((f"VthSweep WaitOnIO={wait_on_io}", timed(lambda: sweep.run(pagenos)) / (len(sweep.levels) + 1), nbytes))
+            results.append((f"VthSweep WaitOnIO={wait_on_io}, every other page", timed(lambda: sweep.run(pagenos[::2])) / (len(sweep.levels) + 1), nbytes // 2))
+
+    for name, seconds, nbytes in results:
+        report(name, seconds, nbytes)
+
+@benchmark
+def bench_async():
+    """64 x 8 KiB cache reads, each page followed by ber.compare and 4 ms of blocking host I/O (result files, upload), tR = 60 us, 8 MB/s bus: blocking loop vs AsyncIO."""
+    import asyncio
+    import numpy as np
+    import ber
+    from asyncnand import AsyncIO
+    nand = simulated_io(bytes_per_second = 8e6, page_size = 8192, oob_size = 448, pages_per_block = 64, t_r = 60e-6, t_rcbsy = 3e-6)
+    count = 64
+    expected = np.zeros(nand.PageSize, dtype = np.uint8)
+
+    def analyse(page):
+        ber.compare(expected, page, nand.PageSize)
+        time.sleep(4e-3)
+
+    def blocking():
+        for _, page in nand.read_pages_cached(0, count - 1, remove_oob = True):
+            analyse(page)
+
+    async def overlapped():
+        dev = AsyncIO(nand)
+        async for _, page in dev.read_pages_cached(0, count - 1, remove_oob = True):
+            analyse(page)
+        await dev.close()
+
+    report("blocking", timed(blocking), count * nand.PageSize)
+    report("AsyncIO", timed(lambda: asyncio.run(overlapped())), count * nand.PageSize)
+
+@benchmark
+def bench_metrics():
+    """Per-page read cost on a zero latency simulated chip with metrics disabled and enabled."""
+    nand = simulated_io(latency = 0.0)
+    pages = 200
+
+    def read_pages():
+        for pageno in range(pages):
+            nand.read_page(pageno)
+
+    nand.Progress = None
+    report("metrics disabled", best_of(read_pages, 1) / pages)
+    metrics = nand.enable_metrics()
+    report("metrics enabled", best_of(read_pages, 1) / pages)
+    nand.disable_metrics()
+    assert metrics.counters['cmd_30'] == 5 * pages
+
+@benchmark
+def bench_bad_block_scan():
+    """Bad block scan of 512 blocks (2 LUNs), tR = 50 us, 30 MB/s bus: full page reads vs marker bytes only."""
+    bad = [3, 100, 300, 511]
+    nand = simulated_io(bytes_per_second = 30e6, luns = 2, blocks_per_lun = 256, pages_per_block = 32, bad_blocks = bad, t_r = 50e-6)
+
+    def full_pages():
+        # what check_bad_blocks did: both marker pages read whole
+        return [block for block in range(nand.BlockCount) if any(nand.read_page(block * nand.PagePerBlock + offset, nand.RawPageSize)[nand.PageSize] != 0xff for offset in (0, nand.PagePerBlock - 1))]
+
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert full_pages() == bad
+        results.append(("full page reads", timed(full_pages)))
+        for wait_on_io in (False, True):
+            nand.WaitOnIO = wait_on_io
+            assert nand.scan_bad_blocks() == bad
+            results.append((f"scan_bad_blocks WaitOnIO={wait_on_io}", timed(nand.scan_bad_blocks)))
+        results.append(("check_bad_blocks WaitOnIO=True", timed(nand.check_bad_blocks)))
+
+    for name, seconds in results:
+        report(name, seconds)
+
+@benchmark
+def bench_identify():
+    """IO construction with the default timing_mode = 'auto' on simulated chips with tR = 50 us at 8 MB/s: parameter page
+    read and timing mode verified on the chip, and both from the on-disk cache for a new chip of a cached model and for a
+    reconnect (neither reads ECh or EDh, the cached timing mode is set without verifying it again)."""
+    import tempfile
+    from flashdevice import IO
+    chip = lambda seed: nandsim.NandModel(page_size = 2048, oob_size = 64, t_r = 50e-6, seed = seed)
+    model = chip(1)
+    results = []
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        connect = lambda model, cache: IO(transport = nandsim.SimulatedFtdi(model, latency = USB_LATENCY, bytes_per_second = 8e6), parameter_page_cache = cache)
+        results.append(("no cache", min(timed(lambda: connect(model, False)) for _ in range(5))))
+        connect(model, directory)
+        others = [chip(seed) for seed in range(2, 7)]
+        results.append(("new chip, cached model", min(timed(lambda other = other: connect(other, directory)) for other in others)))
+        results.append(("cached", min(timed(lambda: connect(model, directory)) for _ in range(5))))
+
+    for name, seconds in results:
+        report(name, seconds)
+
+# import flashdevice must stay well under this, and must not pull in these modules
+IMPORT_BUDGET = 0.2
+IMPORT_HEAVY_MODULES = ('numpy', 'matplotlib', 'pyftdi')
+
+@benchmark
+def bench_import():
+    """Fresh interpreter: import flashdevice, and import flashdevice plus opening a simulated chip, against IMPORT_BUDGET."""
+    import subprocess
+    import sys
+    probe = "\n".join(("import contextlib, io, sys, time",
+                        "start = time.perf_counter()",
+                        "import flashdevice",
+                        "imported = time.perf_counter() - start",
+                        "with contextlib.redirect_stdout(io.StringIO()):",
+                        "    flashdevice.IO(simulation_mode = True)",
+                        "opened = time.perf_counter() - start",
+                        f"print(imported, opened, *[name for name in {IMPORT_HEAVY_MODULES!r} if name in sys.modules])"))
+    runs = [subprocess.run([sys.executable, '-c', probe], capture_output = True, text = True, check = True, cwd = os.path.dirname(os.path.abspath(__file__))).stdout.split() for _ in range(5)]
+    imported = min(float(run[0]) for run in runs)
+    opened = min(float(run[1]) for run in runs)
+    heavy = sorted(set(name for run in runs for name in run[2:]))
+
+    report("import flashdevice", imported)
+    report("import flashdevice + IO(simulation_mode = True)", opened)
+    print(f"budget {IMPORT_BUDGET*1e3:.0f} ms: {'ok' if imported < IMPORT_BUDGET else 'EXCEEDED'}, heavy modules loaded: {', '.join(heavy) or 'none'}")
+    assert imported < IMPORT_BUDGET and not heavy
+
+def _program_and_read_block(nand, block):
+    # campaign task: erase, program and read back one block
+    first_page = block * nand.PagePerBlock
+    payload = bytes(nand.RawPageSize)
+    nand.erase_block_by_page(first_page)
+    nand.write_pages_cached(first_page, [payload] * nand.PagePerBlock)
+    return sum(page == payload for _, page in nand.read_pages_cached(first_page, first_page + nand.PagePerBlock - 1))
+
+@benchmark
+def bench_campaign():
+    """8 blocks erased, programmed and read back by run_campaign on 1, 2 and 4 simulated adapters, 125 us USB latency."""
+    from campaign import run_campaign
+    blocks = range(8)
+    results = []
+    for count in (1, 2, 4):
+        adapters = [{'transport': nandsim.SimulatedFtdi(nandsim.NandModel(page_size = 2048, oob_size = 64, pages_per_block = 32), latency = USB_LATENCY, bytes_per_second = 30e6)}
+                    for _ in range(count)]
+        merged = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            seconds = timed(lambda: merged.update(run_campaign(_program_and_read_block, blocks, adapters)))
+        assert len(merged) == len(blocks) and all(pages == 32 for pages in merged.values())
+        results.append((f"run_campaign, {count} adapter(s)", seconds, len(blocks) * 32 * (2048 + 64) * 2))
+
+    for name, seconds, nbytes in results:
+        report(name, seconds, nbytes)
+
+def save_baseline(path):
+    with open(path + '.tmp', 'w') as fd:
+        json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'created': time.time(), 'results': RESULTS}, fd, indent = 1, sort_keys = True)
+    os.replace(path + '.tmp', path)
+
+def compare_baseline(path, threshold = THRESHOLD):
+    """Prints every result against the baseline in 'path' and returns the regressions."""
+    with open(path) as fd:
+        baseline = json.load(fd)['results']
+
+    regressions = []
+    print(f"== against {path}, threshold +{threshold:.0%}")
+    for name, seconds in RESULTS.items():
+        if name not in baseline:
+            print(f"{name:<72} {'new':>10}")
+            continue
+        ratio = seconds / baseline[name] if baseline[name] else float('inf')
+        regressed = ratio > 1 + threshold and max(seconds, baseline[name]) >= MIN_COMPARED
+        print(f"{name:<72} {ratio:9.2f}x{'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+def main():
+    global _current
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('names', nargs = '*', help = 'benchmarks to run: ' + ', '.join(sorted(BENCHMARKS)))
+    parser.add_argument('--save', nargs = '?', const = BASELINE, metavar = 'PATH', help = f"store the results as a baseline (default {BASELINE})")
+    parser.add_argument('--compare', nargs = '?', const = BASELINE, metavar = 'PATH', help = f"compare the results with a baseline (default {BASELINE})")
+    parser.add_argument('--threshold', type = float, default = THRESHOLD, help = f"slowdown reported as a regression, as a fraction (default {THRESHOLD})")
+    parser.add_argument('--large', action = 'store_true', help = 'include the 1 GiB compute_ber inputs')
+    args = parser.parse_args()
+
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error('unknown benchmark: ' + ', '.join(unknown))
+    if args.compare and not os.path.exists(args.compare):
+        parser.error(f"no baseline at {args.compare}")
+    if args.large:
+        COMPUTE_BER_SIZES.extend(LARGE_COMPUTE_BER_SIZES)
+
+    for name in args.names or sorted(BENCHMARKS):
+        _current = name
+        print(f"== {name}: {BENCHMARKS[name].__doc__}")
+        BENCHMARKS[name]()
+
+    regressions = compare_baseline(args.compare, args.threshold) if args.compare else []
+    if args.save:
+        save_baseline(args.save)
+        print(f"I: Baseline saved to {args.save}")
+    if regressions:
+        print(f"E: {len(regressions)} result(s) more than {args.threshold:.0%} slower than the baseline")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
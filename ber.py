@@ -0,0 +1,238 @@
+# pylint: disable=invalid-name
+# pylint: disable=line-too-long
+"""Vectorized bit error counting.
+
+Inputs are compared in chunks of whole pages with an XOR, and only the
+differing bytes go on to the popcount (np.bitwise_count, or a 256 entry
+lookup table on older NumPy) and the per-page/per-column histograms.  Files
+are memory-mapped and never loaded whole: a multi-GB dump takes seconds.
+
+    result = ber.compare('pattern.bin', 'dump.bin', page_size = nand.RawPageSize)
+    result.bits, result.ber, result.page_bits.argmax(), result.column_bits
+"""
+import heapq
+import json
+import os
+import numpy as np
+
+CHUNK_SIZE = 1 << 26
+
+POPCOUNT_TABLE = np.array([bin(value).count('1') for value in range(256)], dtype = np.uint8)
+
+def popcount(data):
+    """Returns the number of set bits of every byte of a uint8 array."""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(data)
+    return POPCOUNT_TABLE[data]
+
+def as_array(source):
+    """Returns 'source' as a flat uint8 array without copying.
+
+    Accepts a file path (memory-mapped read only), bytes, bytearray,
+    memoryview, mmap or a NumPy array.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        if os.path.getsize(source) == 0:
+            return np.zeros(0, dtype = np.uint8)
+        return np.memmap(source, dtype = np.uint8, mode = 'r')
+    if isinstance(source, np.ndarray):
+        return source.reshape(-1).view(np.uint8)
+    return np.frombuffer(source, dtype = np.uint8)
+
+def count_bit_errors(expected, actual):
+    """Returns the number of differing bits over the common length."""
+    expected = as_array(expected)
+    actual = as_array(actual)
+    length = min(len(expected), len(actual))
+    return int(popcount(expected[:length] ^ actual[:length]).sum(dtype = np.int64))
+
+class BerResult:
+    """Bit error counts of one comparison.
+
+    bits/bytes: differing bits and bytes, of bits_compared/bytes_compared.
+    flips_0_to_1/flips_1_to_0: differing bits by direction, expected to actual.
+    page_bits/column_bits: bit errors per page and per byte offset within a
+    page (empty without a page size).  length_difference: bytes one input
+    has beyond the end of the other, not compared.
+    """
+    __slots__ = ('bits', 'bytes', 'bits_compared', 'bytes_compared', 'flips_0_to_1', 'flips_1_to_0', 'page_size', 'page_bits', 'column_bits', 'length_difference')
+
+    def __init__(self, page_size = None):
+        self.bits = 0
+        self.bytes = 0
+        self.bits_compared = 0
+        self.bytes_compared = 0
+        self.flips_0_to_1 = 0
+        self.flips_1_to_0 = 0
+        self.page_size = page_size
+        self.page_bits = np.zeros(0, dtype = np.int64)
+        self.column_bits = np.zeros(page_size or 0, dtype = np.int64)
+        self.length_difference = 0
+
+    @property
+    def ber(self):
+        return self.bits / self.bits_compared if self.bits_compared else 0.0
+
+    def as_dict(self):
+        return {'bits': self.bits, 'bytes': self.bytes, 'bits_compared': self.bits_compared, 'bytes_compared': self.bytes_compared,
+                'ber': self.ber, 'flips_0_to_1': self.flips_0_to_1, 'flips_1_to_0': self.flips_1_to_0, 'page_size': self.page_size,
+                'page_bits': self.page_bits.tolist(), 'column_bits': self.column_bits.tolist(), 'length_difference': self.length_difference}
+
+    def __repr__(self):
+        return f"BerResult(bits={self.bits}/{self.bits_compared}, bytes={self.bytes}/{self.bytes_compared}, 0->1={self.flips_0_to_1}, 1->0={self.flips_1_to_0})"
+
+def compare(expected, actual, page_size = None, chunk_size = CHUNK_SIZE):
+    """Compares two inputs (see as_array) and returns a BerResult.
+
+    With page_size the per-page and per-column counts are filled in, the
+    last page may be partial.
+    """
+    expected = as_array(expected)
+    actual = as_array(actual)
+    length = min(len(expected), len(actual))
+    result = BerResult(page_size)
+    result.bytes_compared = length
+    result.bits_compared = length * 8
+    result.length_difference = abs(len(expected) - len(actual))
+    if page_size:
+        chunk_size = max(1, chunk_size // page_size) * page_size
+        page_bits = []
+
+    for start in range(0, length, chunk_size):
+        end = min(start + chunk_size, length)
+        act = actual[start:end]
+        diff = expected[start:end] ^ act
+        # errors are sparse, everything past this point only sees the differing bytes
+        offsets = np.flatnonzero(diff)
+        if page_size:
+            pages = -(-(end - start) // page_size)
+        if not len(offsets):
+            if page_size:
+                page_bits.append(np.zeros(pages, dtype = np.int64))
+            continue
+
+        diff = diff[offsets]
+        counts = popcount(diff)
+        bits = int(counts.sum(dtype = np.int64))
+        rising = int(popcount(diff & act[offsets]).sum(dtype = np.int64))
+        result.bits += bits
+        result.bytes += len(offsets)
+        result.flips_0_to_1 += rising
+        result.flips_1_to_0 += bits - rising
+
+        if page_size:
+            page_bits.append(np.bincount(offsets // page_size, weights = counts, minlength = pages).astype(np.int64))
+            result.column_bits += np.bincount(offsets % page_size, weights = counts, minlength = page_size).astype(np.int64)
+
+    if page_size and page_bits:
+        result.page_bits = np.concatenate(page_bits)
+    return result
+
+class BerAccumulator:
+    """Running bit error statistics over pages consumed as they are read.
+
+    add() takes one page at a time and only updates counters: totals, 0->1
+    and 1->0 flips, a per-column histogram, a histogram of errors per page
+    (what the ECC has to correct), totals per P/E cycle and per pattern and
+    the worst_pages worst pages (none when worst_pages is 0).  Memory does
+    not grow with the number of pages, and save()/load() checkpoint the
+    state between runs.
+    """
+    def __init__(self, page_size, worst_pages = 16):
+        self.page_size = page_size
+        self.worst_pages = worst_pages
+        self.pages = 0
+        self.bits = 0
+        self.bits_compared = 0
+        self.flips_0_to_1 = 0
+        self.flips_1_to_0 = 0
+        self.column_bits = np.zeros(page_size, dtype = np.int64)
+        # bit errors in a page -> number of pages
+        self.errors_per_page = {}
+        # P/E cycle or pattern -> [pages, bits, bits_compared]
+        self.by_cycle = {}
+        self.by_pattern = {}
+        # min-heap of (bits, page count when added, block, page, cycle, pattern)
+        self.worst = []
+
+    @property
+    def ber(self):
+        return self.bits / self.bits_compared if self.bits_compared else 0.0
+
+    def add(self, expected, actual, block = None, page = None, cycle = None, pattern = None):
+        """Adds one page and returns its number of bit errors."""
+        expected = as_array(expected)
+        actual = as_array(actual)
+        length = min(len(expected), len(actual), self.page_size)
+        act = actual[:length]
+        diff = expected[:length] ^ act
+        offsets = np.flatnonzero(diff)
+        bits = 0
+        if len(offsets):
+            diff = diff[offsets]
+            counts = popcount(diff)
+            bits = int(counts.sum(dtype = np.int64))
+            rising = int(popcount(diff & act[offsets]).sum(dtype = np.int64))
+            self.flips_0_to_1 += rising
+            self.flips_1_to_0 += bits - rising
+            np.add.at(self.column_bits, offsets, counts)
+
+        self.bits += bits
+        self.bits_compared += length * 8
+        self.errors_per_page[bits] = self.errors_per_page.get(bits, 0) + 1
+        for totals, key in ((self.by_cycle, cycle), (self.by_pattern, pattern)):
+            if key is not None:
+                entry = totals.setdefault(key, [0, 0, 0])
+                entry[0] += 1
+                entry[1] += bits
+                entry[2] += length * 8
+
+        record = (bits, self.pages, block, page, cycle, pattern)
+        if len(self.worst) < self.worst_pages:
+            heapq.heappush(self.worst, record)
+        elif self.worst and bits > self.worst[0][0]:
+            heapq.heapreplace(self.worst, record)
+        self.pages += 1
+        return bits
+
+    def worst_list(self):
+        """Returns (bits, block, page, cycle, pattern) of the worst pages, most bit errors first."""
+        return [(bits, *where) for bits, _, *where in sorted(self.worst, reverse = True)]
+
+    def state(self):
+        return {'page_size': self.page_size, 'worst_pages': self.worst_pages, 'pages': self.pages, 'bits': self.bits,
+                'bits_compared': self.bits_compared, 'flips_0_to_1': self.flips_0_to_1, 'flips_1_to_0': self.flips_1_to_0,
+                'column_bits': self.column_bits.tolist(),
+                'errors_per_page': [[bits, count] for bits, count in sorted(self.errors_per_page.items())],
+                'by_cycle': [[key, *value] for key, value in self.by_cycle.items()],
+                'by_pattern': [[key, *value] for key, value in self.by_pattern.items()],
+                'worst': [list(record) for record in self.worst]}
+
+    @classmethod
+    def from_state(cls, state):
+        accumulator = cls(state['page_size'], state['worst_pages'])
+        for name in ('pages', 'bits', 'bits_compared', 'flips_0_to_1', 'flips_1_to_0'):
+            setattr(accumulator, name, state[name])
+        accumulator.column_bits = np.array(state['column_bits'], dtype = np.int64)
+        accumulator.errors_per_page = {bits: count for bits, count in state['errors_per_page']}
+        accumulator.by_cycle = {key: list(value) for key, *value in state['by_cycle']}
+        accumulator.by_pattern = {key: list(value) for key, *value in state['by_pattern']}
+        accumulator.worst = [tuple(record) for record in state['worst']]
+        heapq.heapify(accumulator.worst)
+        return accumulator
+
+    def save(self, path):
+        """Checkpoints the state to 'path' (JSON), replacing it atomically."""
+        with open(path + '.tmp', 'w') as checkpoint:
+            checkpoint.write(json.dumps(self.state()))
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path, page_size = None, worst_pages = 16):
+        """Resumes from a checkpoint written by save(), or starts a new
+        accumulator for page_size if 'path' does not exist yet.
+        """
+        if not os.path.exists(path):
+            return cls(page_size, worst_pages)
+        with open(path) as checkpoint:
+            return cls.from_state(json.load(checkpoint))
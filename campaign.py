@@ -0,0 +1,88 @@
+# pylint: disable=invalid-name
+# pylint: disable=line-too-long
+"""Runs one characterization task on several FTDI adapters in parallel.
+
+Every adapter gets its own worker process and its own IO, the block list is
+split between the chips (or given to every chip with replicate = True), and
+the per-block results come back merged into one dict:
+
+    def erase_status(nand, block):
+        return nand.erase_block_by_page(block * nand.PagePerBlock)
+
+    results = run_campaign(erase_status, range(100))   # {(adapter, block): status}
+
+The task has to be a module level function so it can be sent to the workers.
+Adapters are IO keyword argument dicts as returned by flashdevice.list_adapters;
+{'simulation_mode': True} or {'transport': nandsim.SimulatedFtdi(...)} work too.
+
+Usage: python campaign.py --list
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from flashdevice import IO, list_adapters
+
+def adapter_label(adapter, index):
+    if adapter.get('serial'):
+        return adapter['serial']
+    if adapter.get('bus') is not None:
+        return f"{adapter['bus']}:{adapter['address']}"
+    return f"adapter{index}"
+
+def split_blocks(blocks, count):
+    """Splits 'blocks' into 'count' contiguous shares of nearly equal size."""
+    blocks = list(blocks)
+    share, extra = divmod(len(blocks), count)
+    shares = []
+    start = 0
+    for index in range(count):
+        end = start + share + (1 if index < extra else 0)
+        shares.append(blocks[start:end])
+        start = end
+    return shares
+
+def _run_on_adapter(adapter, task, blocks, io_args):
+    io_args = dict(io_args, **{key: value for key, value in adapter.items() if key != 'description'})
+    nand = IO(**io_args)
+    return {block: task(nand, block) for block in blocks}
+
+def run_campaign(task, blocks, adapters = None, replicate = False, **io_args):
+    """Calls task(nand, block) for every block, one process per adapter.
+
+    Returns {(adapter label, block): result}.  io_args are passed to every IO,
+    e.g. do_slow.  An adapter that fails is reported and left out of the
+    results, the others still complete.
+    """
+    adapters = list_adapters() if adapters is None else list(adapters)
+    if not adapters:
+        print("E: No FTDI adapters found")
+        return {}
+
+    shares = [list(blocks)] * len(adapters) if replicate else split_blocks(blocks, len(adapters))
+    results = {}
+    with ProcessPoolExecutor(max_workers = len(adapters)) as pool:
+        futures = [(adapter_label(adapter, index), pool.submit(_run_on_adapter, adapter, task, share, io_args))
+                   for index, (adapter, share) in enumerate(zip(adapters, shares)) if share]
+        for label, future in futures:
+            try:
+                adapter_results = future.result()
+            except (Exception, SystemExit) as error:
+                print(f"E: Adapter {label} failed: {error!r}")
+                continue
+            for block, result in adapter_results.items():
+                results[(label, block)] = result
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--list', action = 'store_true', help = 'list the attached FT2232 adapters')
+    args = parser.parse_args()
+
+    if args.list:
+        for index, adapter in enumerate(list_adapters()):
+            print(f"{adapter_label(adapter, index)}\tbus {adapter['bus']} address {adapter['address']}\t{adapter['description']}")
+    else:
+        parser.print_help()
+
+if __name__ == '__main__':
+    main()
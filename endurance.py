@@ -0,0 +1,147 @@
+# pylint: disable=invalid-name
+# pylint: disable=line-too-long
+"""P/E cycling endurance runner.
+
+Every cycle erases, programs and (every read_interval cycles, and on the last
+one) reads back each block, the way write_block_get_ber does for a single
+pass.  The USB operations run on the calling thread; the BER computation,
+the results file and the checkpoint run on a worker thread, so block k is
+being evaluated while block k+1 is on the bus.
+
+    run = EnduranceRun(nand, range(10, 20), 3000, 'endurance')
+    accumulator = run.run()        # ber.BerAccumulator over all read-backs
+
+Results are appended to '<name>.csv' (block, P/E cycle, erase and
+program failure bits, 0 on success, bit errors, bits compared; the last two
+are empty for cycles without a read-back) and the next block to cycle is
+checkpointed with the accumulator to '<name>.checkpoint', so calling run()
+again after an interruption carries on from there.  The checkpoint also
+records the length of the results file and of the store, and a resume cuts
+both back to it, so rows written after the last checkpoint are not
+duplicated.  A checkpoint of a run with other blocks, cycles, seed or
+read_interval is refused.  Pages are random data derived from (seed, block,
+cycle), so a resumed run programs what the first one would have.  With a
+resultstore.ResultStore as 'store', the bit errors of every page read back
+are appended to it as well.
+"""
+import json
+import os
+import queue
+import threading
+import numpy as np
+import ber
+import flashdevice_defs
+import resultstore
+
+class EnduranceRun:
+    def __init__(self, nand, blocks, cycles, name, read_interval = 1, seed = 0, pipeline = True, store = None):
+        self.nand = nand
+        self.blocks = list(blocks)
+        self.cycles = cycles
+        self.results_path = name + '.csv'
+        self.checkpoint_path = name + '.checkpoint'
+        self.read_interval = max(1, read_interval)
+        self.seed = seed
+        self.pipeline = pipeline
+        self.store = store
+        self.accumulator = None
+        self.error = None
+
+    def pattern(self, block, cycle):
+        """Returns the page data programmed into 'block' in 'cycle', one row per page."""
+        rng = np.random.default_rng((self.seed, block, cycle))
+        return rng.integers(0, 256, size = (self.nand.PagePerBlock, self.nand.PageSize), dtype = np.uint8)
+
+    def __settings(self):
+        return {'blocks': self.blocks, 'cycles': self.cycles, 'seed': self.seed, 'read_interval': self.read_interval}
+
+    def __load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            self.accumulator = ber.BerAccumulator(self.nand.PageSize)
+            return 0
+        with open(self.checkpoint_path) as checkpoint:
+            state = json.load(checkpoint)
+        if {name: state.get(name) for name in self.__settings()} != self.__settings():
+            raise ValueError(f"{self.checkpoint_path} belongs to a run with other blocks, cycles, seed or read interval; remove it to start over")
+
+        # rows written between the last checkpoint and the interruption are written again
+        if os.path.exists(self.results_path):
+            with open(self.results_path, 'r+') as results:
+                results.truncate(state['results_size'])
+        if self.store is not None and state['store_rows'] is not None:
+            self.store.truncate(state['store_rows'])
+        self.accumulator = ber.BerAccumulator.from_state(state['accumulator'])
+        return state['next']
+
+    def __save_checkpoint(self, position):
+        state = dict(self.__settings(), next = position, accumulator = self.accumulator.state(),
+                     results_size = os.path.getsize(self.results_path), store_rows = self.store.rows if self.store is not None else None)
+        with open(self.checkpoint_path + '.tmp', 'w') as checkpoint:
+            checkpoint.write(json.dumps(state))
+        os.replace(self.checkpoint_path + '.tmp', self.checkpoint_path)
+
+    # USB side of one block in one cycle: erase, program and maybe read back
+    def __cycle_block(self, block, cycle):
+        first_page = block * self.nand.PagePerBlock
+        pages = self.pattern(block, cycle)
+        erase_status = self.nand.erase_block_by_page(first_page) & flashdevice_defs.NAND_STATUS_FAIL
+        program_status = self.nand.write_pages_cached(first_page, pages)
+        read_back = None
+        if (cycle + 1) % self.read_interval == 0 or cycle == self.cycles - 1:
+            read_back = [data for _, data in self.nand.read_pages_cached(first_page, first_page + self.nand.PagePerBlock - 1, remove_oob = True)]
+        return erase_status, program_status, pages, read_back
+
+    # Host side: BER, results line and checkpoint for one block
+    def __evaluate(self, position, block, cycle, erase_status, program_status, pages, read_back):
+        bits = compared = ''
+        if read_back is not None:
+            page_bits = [self.accumulator.add(expected, actual, block, pageno, cycle + 1, 'random')
+                         for pageno, (expected, actual) in enumerate(zip(pages, read_back))]
+            bits = sum(page_bits)
+            compared = len(read_back) * self.nand.PageSize * 8
+            if self.store is not None:
+                self.store.append_block(resultstore.chip_name(self.nand), block, cycle + 1, 'random', page_bits, self.nand.PageSize * 8)
+        with open(self.results_path, 'a') as results:
+            results.write(f"{block},{cycle + 1},{erase_status},{program_status},{bits},{compared}\n")
+        self.__save_checkpoint(position + 1)
+
+    def __consume(self, work):
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            if self.error is None:
+                try:
+                    self.__evaluate(*item)
+                except Exception as error:
+                    self.error = error
+
+    def run(self):
+        """Cycles every block until 'cycles' P/E cycles are done and returns the accumulator."""
+        position = self.__load_checkpoint()
+        total = len(self.blocks) * self.cycles
+        # at most one block waiting, so a slow host side throttles the bus instead of piling up reads
+        work = queue.Queue(maxsize = 1)
+        worker = threading.Thread(target = self.__consume, args = (work,), daemon = True) if self.pipeline else None
+        if worker is not None:
+            worker.start()
+
+        try:
+            while position < total and self.error is None:
+                cycle, index = divmod(position, len(self.blocks))
+                block = self.blocks[index]
+                item = (position, block, cycle) + self.__cycle_block(block, cycle)
+                if worker is not None:
+                    work.put(item)
+                else:
+                    self.__evaluate(*item)
+                position += 1
+                self.nand.report_progress("Cycling block", position, total)
+        finally:
+            if worker is not None:
+                work.put(None)
+                worker.join()
+
+        if self.error is not None:
+            raise self.error
+        return self.accumulator
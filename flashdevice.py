@@ -1,19 +1,66 @@
 # pylint: disable=invalid-name
 # pylint: disable=line-too-long
-from array import array as Array
 import time
+import json
+import mmap
+import os
 import struct
 import sys
 import traceback
-from pyftdi import ftdi
 import flashdevice_defs
-import utils
-from matplotlib import pyplot
-import csv
-import numpy as np
+import metrics
+import mpsse
+import nandsim
+import onfi
+import scheduler
+# NumPy and matplotlib are only imported by the analysis methods that use them
+# .. (ber, utils, report), so importing this module stays fast
+
+FTDI_VENDOR = 0x0403
+FTDI_PRODUCT_FT2232 = 0x6010
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'onfi-interface')
+PARAMETER_PAGE_CACHE = os.path.join(CACHE_DIR, 'parameter_pages')
+BAD_BLOCK_TABLE_DIR = os.path.join(CACHE_DIR, 'bad_block_tables')
+
+# pyftdi is imported on first use: only hardware needs it, the simulator runs without it
+def _pyftdi():
+    try:
+        from pyftdi import ftdi
+    except ImportError:
+        return None
+    return ftdi
+
+# Default IO.Progress: one line per report
+def print_progress(operation, done, total):
+    print(f"I: {operation} {done}/{total}")
+
+# Lists the attached FT2232 adapters, one dict per adapter holding the IO
+# .. keyword arguments that open it (serial, bus, address) and its description
+def list_adapters():
+    ftdi = _pyftdi()
+    if ftdi is None:
+        print("E: pyftdi is not installed")
+        return []
+
+    adapters = []
+    for descriptor, _ in ftdi.Ftdi.list_devices():
+        if descriptor.vid != FTDI_VENDOR or descriptor.pid != FTDI_PRODUCT_FT2232:
+            continue
+        adapters.append({'serial': descriptor.sn, 'bus': descriptor.bus, 'address': descriptor.address, 'description': descriptor.description})
+    return adapters
 
 class IO:
-    def __init__(self, do_slow = False, debug = 0, simulation_mode = False):
+    # transport: any object implementing the subset of pyftdi.ftdi.Ftdi used here,
+    # .. e.g. nandsim.SimulatedFtdi. simulation_mode without a transport uses a default nandsim.NandModel
+    # .. serial, bus and address select one of several attached adapters (see list_adapters),
+    # .. without them the first FT2232 found is used
+    # .. parameter_page_cache: directory caching ONFI parameter pages by chip ID, False to always read them.
+    # .. The default is PARAMETER_PAGE_CACHE, or no cache for the simulator whose chips change between runs
+    # .. timing_mode: 'auto' runs the fastest supported ONFI timing mode that passes transfer
+    # .. verification (see select_timing_mode; with the parameter page cache the mode verified
+    # .. before is set without verifying again), a number sets that mode, None leaves the chip as it is
+    def __init__(self, do_slow = False, debug = 0, simulation_mode = False, transport = None, serial = None, bus = None, address = None, parameter_page_cache = None,
+                 timing_mode = 'auto'):
         self.Debug = debug
         self.PageSize = 0
         self.OOBSize = 0
@@ -28,32 +75,71 @@ class IO:
         self.UseAnsi = False
         self.Slow = do_slow
         self.Identified = False
-        self.SimulationMode = simulation_mode
-
-        try:
-            self.ftdi = ftdi.Ftdi()
-        except:
-            print("Error openging FTDI device")
-            self.ftdi = None
-
-        if self.ftdi is not None:
-            try:
-                self.ftdi.open(0x0403, 0x6010, interface = 1)
-            except:
-                traceback.print_exc(file = sys.stdout)
-
-            if self.ftdi.is_connected:
-                self.ftdi.set_bitmode(0, self.ftdi.BITMODE_MCU)
-
-                if self.Slow:
-                    # Clock FTDI chip at 12MHz instead of 60MHz
-                    self.ftdi.write_data(Array('B', [ftdi.Ftdi.ENABLE_CLK_DIV5]))
-                else:
-                    self.ftdi.write_data(Array('B', [ftdi.Ftdi.DISABLE_CLK_DIV5]))
+        self.SimulationMode = simulation_mode or isinstance(transport, nandsim.SimulatedFtdi)
+        # Ready/busy waiting: give up after ReadyTimeout seconds, poll the status
+        # .. register (70h) instead of R/B# when PollStatus is set, and make the first
+        # .. poll after FirstPollRatio of the operation's maximum time from the parameter page
+        self.ReadyTimeout = 1.0
+        self.PollStatus = False
+        self.FirstPollRatio = 0.5
+        self.MaxPollInterval = 0.001
+        self.tRMax = 0.0
+        self.tPROGMax = 0.0
+        self.tBERSMax = 0.0
+        # tFEAT, busy time of SET/GET FEATURES (ONFI maximum, not in the parameter page)
+        self.tFEATMax = 1e-6
+        # tCCS, change column setup: E0h to data output, from the parameter page
+        self.tCCSMin = mpsse.T_CCS
+        # Last known value of each feature address, so set_features/get_features can skip
+        # .. the bus when nothing changes. Cleared by reset(); turn off ShadowFeatures
+        # .. for registers the chip changes on its own
+        self.ShadowFeatures = True
+        self.FeatureShadow = {}
+        self.Features = 0
+        self.OptionalCommands = 0
+        # asynchronous timing modes from the parameter page (bit n: mode n) and the one in use
+        self.TimingModes = 1
+        self.TimingMode = None
+        # first five READ ID bytes, the key of the parameter page cache
+        self.JedecID = b''
+        self.Planes = 1
+        self.PlaneAddressBits = 0
+        self.PageAddressBits = 0
+        self.BlockAddressBits = 0
+        self.MultiPlaneAttributes = 0
+        # Set when R/B# is wired to the FT2232 I/O1 pin, so operations can wait
+        # .. with the MPSSE wait-on-I/O opcode inside their transaction
+        self.WaitOnIO = False
+        # where get_bad_blocks keeps the bad block table of each chip, by unique ID
+        self.BadBlockTableDir = BAD_BLOCK_TABLE_DIR
+        # READ UNIQUE ID result, see get_unique_id
+        self.UniqueID = None
+        # decoded ONFI parameter page, set by identification
+        self.ParameterPage = None
+        # metrics.Metrics while enabled (see enable_metrics), None otherwise
+        self.Metrics = None
+        # Progress(operation, done, total) of page reads, writes, dumps and erases, called at most once
+        # .. every ProgressInterval seconds; None to stay quiet
+        self.Progress = print_progress
+        self.ProgressInterval = 1.0
+        self.LastProgress = 0.0
+        if parameter_page_cache is None:
+            parameter_page_cache = not self.SimulationMode and PARAMETER_PAGE_CACHE
+        self.ParameterPageCache = parameter_page_cache
+
+        if transport is not None:
+            self.ftdi = transport
+        elif self.SimulationMode:
+            self.ftdi = nandsim.SimulatedFtdi()
+        else:
+            self.ftdi = self.__open_ftdi(serial, bus, address)
 
-                self.ftdi.set_latency_timer(self.ftdi.LATENCY_MIN)
-                self.ftdi.purge_buffers()
-                self.ftdi.write_data(Array('B', [ftdi.Ftdi.SET_BITS_HIGH, 0x0, 0x1]))
+        if self.ftdi is not None and self.ftdi.is_connected:
+            self.ftdi.set_bitmode(0, self.ftdi.BITMODE_MCU)
+            self.__set_clock(self.Slow)
+            self.ftdi.set_latency_timer(self.ftdi.LATENCY_MIN)
+            self.ftdi.purge_buffers()
+            self.__transfer(mpsse.GPIO_HIGH)
 
         self.__wait_ready()
         
@@ -61,46 +147,112 @@ class IO:
             print(f"E: Unable to read the device information")
             sys.exit(-1)
 
-    def __wait_ready(self):
+        if timing_mode == 'auto':
+            self.select_timing_mode()
+        elif timing_mode is not None:
+            self.set_timing_mode(timing_mode, self.Slow)
+
+    def __set_clock(self, slow):
+        if slow:
+            # Clock FTDI chip at 12MHz instead of 60MHz
+            self.__transfer(bytes([flashdevice_defs.MPSSE_ENABLE_CLK_DIV5]))
+        else:
+            self.__transfer(bytes([flashdevice_defs.MPSSE_DISABLE_CLK_DIV5]))
+        self.Slow = slow
+
+    @staticmethod
+    def __open_ftdi(serial = None, bus = None, address = None):
+        ftdi = _pyftdi()
+        if ftdi is None:
+            print("E: pyftdi is not installed")
+            return None
+
+        try:
+            device = ftdi.Ftdi()
+        except:
+            print("Error openging FTDI device")
+            return None
+
+        try:
+            device.open(FTDI_VENDOR, FTDI_PRODUCT_FT2232, bus = bus, address = address, serial = serial, interface = 1)
+        except:
+            traceback.print_exc(file = sys.stdout)
+
+        return device
+
+    # expected: maximum duration of the operation being waited for (tR, tPROG, tBERS)
+    # .. data_out: the operation was a read, so return the chip to data output
+    # .. if the status register was used for polling
+    # .. status: poll the status register even without PollStatus and return its last value
+    def __wait_ready(self, expected = 0.0, data_out = False, timeout = None, status = False):
         if self.ftdi is None or not self.ftdi.is_connected:
             print(f"E: Ftdi device not found")
             return
 
-        print(f"I: Ftdi found, waiting")
-        while 1:
-            print(f".", end =" ")
-            self.ftdi.write_data(Array('B', [ftdi.Ftdi.GET_BITS_HIGH]))
-            data = self.ftdi.read_data_bytes(1)
-            if not data or len(data) <= 0:
-                raise Exception('FTDI device Not ready. Try restarting it.')
+        started = time.perf_counter()
+        deadline = time.perf_counter() + (self.ReadyTimeout if timeout is None else timeout)
+        if expected > 0:
+            # polling any earlier only spends USB round trips
+            time.sleep(expected * self.FirstPollRatio)
+
+        interval = self.MaxPollInterval / 64
+        while True:
+            ready = self.__is_ready(status)
+            if ready:
+                break
+            if time.perf_counter() > deadline:
+                raise TimeoutError('NAND still busy after %.3f s' % (self.ReadyTimeout if timeout is None else timeout))
+            time.sleep(interval)
+            interval = min(interval * 2, self.MaxPollInterval)
 
-            if  data[0] & 2 == 0x2:
-                return
+        if data_out and self.PollStatus:
+            self.__send_cmd(flashdevice_defs.NAND_CMD_READ0)
+        if self.Metrics is not None:
+            self.Metrics.observe('wait_ready', time.perf_counter() - started)
+        return ready
+
+    # Returns 0 while busy, otherwise the byte polled (status register or GPIO)
+    def __is_ready(self, status = False):
+        if self.Metrics is not None:
+            self.Metrics.count('ready_polls')
+        if self.PollStatus or status:
+            # 70h, tWHR and the status byte read in a single round trip
+            data = self.__submit(self.__transaction().command(flashdevice_defs.NAND_CMD_STATUS).data_out(1))
+            ready_mask = flashdevice_defs.NAND_STATUS_READY
+        else:
+            data = self.__transfer(bytes([flashdevice_defs.MPSSE_GET_BITS_HIGH]), 1, bus = False)
+            ready_mask = 0x2
 
-            if self.Debug > 0:
-                print('Not Ready', data)
+        if not data or len(data) <= 0:
+            raise Exception('FTDI device Not ready. Try restarting it.')
 
-        return
+        return data[0] if data[0] & ready_mask == ready_mask else 0
 
     def __read(self, cl, al, count):
-        cmds = []
-        cmd_type = 0
-        if cl == 1:
-            cmd_type |= flashdevice_defs.ADR_CL
-        if al == 1:
-            cmd_type |= flashdevice_defs.ADR_AL
+        if self.ftdi is None or not self.ftdi.is_connected:
+            return
 
-        cmds += [ftdi.Ftdi.READ_EXTENDED, cmd_type, 0]
+        return self.__transfer(mpsse.encode_read(mpsse.cmd_type(cl, al, not self.WriteProtect), count), count)
 
-        for _ in range(1, count, 1):
-            cmds += [ftdi.Ftdi.READ_SHORT, 0]
+    # Every write to the adapter goes through here: writes 'stream', reads back
+    # .. 'read_count' bytes (bus data, see __read_back, unless bus is False) and with
+    # .. metrics enabled counts the exchange and the NAND 'commands' it carries
+    def __transfer(self, stream, read_count = 0, commands = (), bus = True):
+        metrics = self.Metrics
+        if metrics is not None:
+            started = time.perf_counter()
 
-        cmds.append(ftdi.Ftdi.SEND_IMMEDIATE)
+        self.ftdi.write_data(stream)
+        data = b''
+        if read_count:
+            data = self.__read_back(read_count) if bus else bytes(self.ftdi.read_data_bytes(read_count))
 
-        if self.ftdi is None or not self.ftdi.is_connected:
-            return
+        if metrics is not None:
+            metrics.commands(commands)
+            metrics.usb(len(stream), read_count, time.perf_counter() - started)
+        return data
 
-        self.ftdi.write_data(Array('B', cmds))
+    def __read_back(self, count):
         if self.is_slow_mode():
             data = self.ftdi.read_data_bytes(count*2)
             data = data[0:-1:2]
@@ -109,58 +261,71 @@ class IO:
         return bytes(data)
 
     def __write(self, cl, al, data):
-        cmds = []
-        cmd_type = 0
-        if cl == 1:
-            cmd_type |= flashdevice_defs.ADR_CL
-        if al == 1:
-            cmd_type |= flashdevice_defs.ADR_AL
-        if not self.WriteProtect:
-            cmd_type |= flashdevice_defs.ADR_WP
-
-        cmds += [ftdi.Ftdi.WRITE_EXTENDED, cmd_type, 0, ord(data[0])]
-
-        for i in range(1, len(data), 1):
-            #if i == 256:
-            #    cmds += [Ftdi.WRITE_SHORT, 0, ord(data[i])]
-            cmds += [ftdi.Ftdi.WRITE_SHORT, 0, ord(data[i])]
-
         if self.ftdi is None or not self.ftdi.is_connected:
             return
 
-        self.ftdi.write_data(Array('B', cmds))
-
-    def __write_bin(self, cl, al, data_bin):
-        cmds = []
-        cmd_type = 0
-        if cl == 1:
-            cmd_type |= flashdevice_defs.ADR_CL
-        if al == 1:
-            cmd_type |= flashdevice_defs.ADR_AL
-        if not self.WriteProtect:
-            cmd_type |= flashdevice_defs.ADR_WP
-
-        cmds += [ftdi.Ftdi.WRITE_EXTENDED, cmd_type, 0, data_bin[0]]
-        
-        for i in range(1, len(data_bin), 1):
-            cmds += [ftdi.Ftdi.WRITE_SHORT, 0, data_bin[i]]
-
-        if self.ftdi is None or not self.ftdi.is_connected:
-            return
-
-        self.ftdi.write_data(Array('B', cmds))
+        self.__transfer(mpsse.encode_write(mpsse.cmd_type(cl, al, not self.WriteProtect), data), commands = bytes(data) if cl else ())
 
     def __send_cmd(self, cmd):
-        self.__write(1, 0, chr(cmd))
+        self.__write(1, 0, bytes((cmd,)))
 
     def __send_address(self, addr, count):
-        data = ''
+        self.__write(0, 1, (addr & ((1 << (8*count)) - 1)).to_bytes(count, 'little'))
 
-        for _ in range(0, count, 1):
-            data += chr(addr & 0xff)
-            addr = addr>>8
+    def __transaction(self):
+        return mpsse.Transaction(not self.WriteProtect, self.tCCSMin)
 
-        self.__write(0, 1, data)
+    def __submit(self, txn):
+        if self.ftdi is None or not self.ftdi.is_connected or not txn.stream:
+            return b''
+
+        data = self.__transfer(txn.encode(), txn.read_count, txn.commands)
+        if len(data) < txn.read_count:
+            raise TimeoutError('NAND returned %d of %d bytes' % (len(data), txn.read_count))
+        return data
+
+    # Ends one step of a multi-step operation (e.g. after 32h/11h/D1h): with WaitOnIO
+    # .. the wait goes into the stream and the transaction continues, otherwise
+    # .. the step is sent and polled and a new transaction starts
+    def __step(self, txn, expected = 0.0):
+        if self.WaitOnIO:
+            return txn.wait_ready()
+        self.__submit(txn)
+        self.__wait_ready(expected)
+        return self.__transaction()
+
+    # Sends 'txn', waits for the chip, then reads the status byte (status) and/or
+    # .. 'data_out' bytes. With WaitOnIO all of it is one USB write and one read,
+    # .. otherwise the wait is a __wait_ready poll between two submissions, and a
+    # .. status on its own is the last status register poll of that wait.
+    # .. read marks array reads, which need 00h after status polling
+    # .. With metrics enabled the whole call is timed as the operation of its last command
+    def __execute(self, txn, expected = 0.0, data_out = 0, status = False, read = False):
+        operation = metrics.OPERATIONS.get(txn.commands[-1]) if self.Metrics is not None and txn.commands else None
+        if operation is not None:
+            started = time.perf_counter()
+
+        if self.WaitOnIO:
+            tail = txn.wait_ready()
+        elif status and not data_out:
+            self.__submit(txn)
+            result = bytes((self.__wait_ready(expected, status = True),))
+            if operation is not None:
+                self.Metrics.observe(operation, time.perf_counter() - started)
+            return result
+        else:
+            self.__submit(txn)
+            self.__wait_ready(expected, data_out = read)
+            tail = self.__transaction()
+
+        if status:
+            tail.command(flashdevice_defs.NAND_CMD_STATUS).data_out(1)
+        if data_out:
+            tail.data_out(data_out)
+        result = self.__submit(tail)
+        if operation is not None:
+            self.Metrics.observe(operation, time.perf_counter() - started)
+        return result
 
     def __get_status(self):
         self.__send_cmd(0x70)
@@ -173,9 +338,6 @@ class IO:
     def __write_data(self, data):
         return self.__write(0, 0, data)
 
-    def __write_data_bin(self, data):
-        return self.__write_bin(0, 0, data)
-
     def __get_id(self):
         self.Name = ''
         self.ID = 0
@@ -185,9 +347,13 @@ class IO:
         self.Options = 0
         self.AddrCycles = 0
 
-        self.__send_cmd(flashdevice_defs.NAND_CMD_READID)
-        self.__send_address(0, 1)
-        flash_identifiers = self.__read_data(8)
+        # READ ID at 00h (JEDEC ID) and at 20h (ONFI signature) in one round trip
+        txn = self.__transaction()
+        txn.command(flashdevice_defs.NAND_CMD_READID).address(0, 1).data_out(8)
+        txn.command(flashdevice_defs.NAND_CMD_READID).address(0x20, 1).data_out(4)
+        identifiers = self.__submit(txn)
+        flash_identifiers = identifiers[:8]
+        self.JedecID = bytes(flash_identifiers[:5])
 
         if not flash_identifiers:
             print(f"E: Could not read ID from address 0")
@@ -206,20 +372,18 @@ class IO:
         #     return False
 
         #Check ONFI
-        self.__send_cmd(flashdevice_defs.NAND_CMD_READID)
-        self.__send_address(0x20, 1)
-        onfitmp = self.__read_data(4)
+        onfitmp = identifiers[8:12]
 
         onfi = (onfitmp[0]==0x4F and onfitmp[1]==0x4E and onfitmp[2]==0x46 and onfitmp[3]==0x49)
 
         # if it is ONFI, it is identified
         if onfi:
             self.Identified = True
-            self.__send_cmd(flashdevice_defs.NAND_CMD_ONFI)
-            self.__send_address(0, 1)
-            self.__wait_ready()
-            onfi_data = self.__read_data(0x100)
-            onfi = onfi_data[0:4] == [0x4F, 0x4E, 0x46, 0x49]
+            parameter_page = self.__get_parameter_page(self.JedecID)
+            if parameter_page is None:
+                print(f"E: No valid ONFI parameter page")
+                self.Identified = False
+                return False
         else:
             # print(f"E: Its not ONFI. Read values are {chr(onfitmp[0]),chr(onfitmp[1]),chr(onfitmp[2]),chr(onfitmp[3])}")
             print(f"E: Its not ONFI. Read values are {(onfitmp[0]),(onfitmp[1]),(onfitmp[2]),(onfitmp[3])}")
@@ -250,31 +414,95 @@ class IO:
             self.Manufacturer = 'Unknown'
 
 # Code added by Prawar 17 Feb 2021
-        self.IDString = ''
-        for id_idx in range(44,64,1):
-            self.IDString += chr(onfi_data[id_idx])
+        self.__apply_parameter_page(parameter_page)
+        return True
 
-        self.ID = onfi_data[64] # 64th byte in ONFI page is Manufacturer ID
-        self.PageSize = onfi_data[80] + 256 * onfi_data[81] + 256 * 256 * onfi_data[82] +  256 * 256 * 256 * onfi_data[83]
-        self.OOBSize = onfi_data[84] + 256 * onfi_data[85]
+    # Parameter page from the on-disk cache when this model (JEDEC ID) has been seen
+    # .. before, otherwise read from the chip (all three copies, see
+    # .. onfi.ParameterPage.from_copies) and cached. Only when chips of the same JEDEC ID
+    # .. were cached with different pages does the unique ID (EDh) pick this chip's
+    def __get_parameter_page(self, jedec_id):
+        cache_dir = self.ParameterPageCache
+        entries = onfi.load_cached_entries(cache_dir, jedec_id) if cache_dir else {}
+        if len(set(page.raw for page in entries.values())) == 1:
+            return next(iter(entries.values()))
+        if entries:
+            self.__apply_parameter_page(next(iter(entries.values())))
+            if self.get_unique_id() in entries:
+                return entries[self.UniqueID]
+
+        txn = self.__transaction()
+        txn.command(flashdevice_defs.NAND_CMD_ONFI).address(0, 1)
+        page = onfi.ParameterPage.from_copies(self.__execute(txn, data_out = 3 * onfi.PARAMETER_PAGE_SIZE, read = True))
+        if page is None:
+            return None
+        if not page.crc_valid:
+            print(f"E: ONFI parameter page CRC mismatch in every copy, using their bitwise majority")
+
+        if cache_dir and page.crc_valid:
+            # a model already cached with another page is told apart by unique ID
+            onfi.store_cached(cache_dir, page, jedec_id, self.UniqueID if entries else None)
+        return page
+
+    def __apply_parameter_page(self, page):
+        self.ParameterPage = page
+        self.IDString = page.model
+        self.ID = page.jedec_id # 64th byte in ONFI page is Manufacturer ID
+        self.PageSize = page.page_size
+        self.OOBSize = page.oob_size
         self.RawPageSize = self.PageSize+self.OOBSize
         self.Options = 1
-        self.PagePerBlock = onfi_data[92] + 256 * onfi_data[93] + 256 * 256 * onfi_data[94] +  256 * 256 * 256 * onfi_data[95]
+        self.PagePerBlock = page.pages_per_block
         self.BlockSize = self.PagePerBlock*self.RawPageSize
         self.RawBlockSize = self.BlockSize
         self.EraseSize = self.BlockSize# size of Block in bytes
-        self.LUNS = onfi_data[100]
-        self.BlockPerLUN = onfi_data[96] + 256 * onfi_data[97] + 256 * 256 * onfi_data[98] +  256 * 256 * 256 * onfi_data[99]
+        self.LUNS = page.luns
+        self.BlockPerLUN = page.blocks_per_lun
+        # widths of the page and block fields of a row address (see row_address)
+        self.PageAddressBits = (self.PagePerBlock - 1).bit_length()
+        self.BlockAddressBits = (self.BlockPerLUN - 1).bit_length()
         self.BlockCount = self.LUNS * self.BlockPerLUN
         self.PageCount = self.BlockCount * self.PagePerBlock
         self.ChipSizeMB = self.PageCount * self.RawPageSize//(1024*1024)
 
-        self.ColumnCycles = ((0xf0&onfi_data[101])>>4)
-        self.RowCycles = (0x0f&onfi_data[101])
+        self.ColumnCycles = page.column_cycles
+        self.RowCycles = page.row_cycles
         self.AddrCycles = self.ColumnCycles+self.RowCycles
-        self.BitsPerCell = onfi_data[102]
+        self.BitsPerCell = page.bits_per_cell
+        self.Features = page.features
+        self.OptionalCommands = page.optional_commands
+        self.TimingModes = page.timing_modes | 1
+        # planes are selected by the low PlaneAddressBits of the block address
+        self.PlaneAddressBits = page.plane_address_bits
+        self.Planes = page.planes
+        self.MultiPlaneAttributes = page.multi_plane_attributes
+        # maximum array timings
+        self.tPROGMax = page.t_prog_max
+        self.tBERSMax = page.t_bers_max
+        self.tRMax = page.t_r_max
+        self.tCCSMin = page.t_ccs_min or mpsse.T_CCS
+
+    # Rate limited call of Progress, see ProgressInterval. Public so long runs built
+    # .. on IO (endurance.EnduranceRun) report through the same callback
+    def report_progress(self, operation, done, total):
+        if self.Progress is None:
+            return
+        now = time.perf_counter()
+        if now - self.LastProgress < self.ProgressInterval:
+            return
+        self.LastProgress = now
+        self.Progress(operation, done, total)
 
-        return True
+    # Starts collecting counters and latencies (see metrics.py) and returns the Metrics
+    def enable_metrics(self):
+        if self.Metrics is None:
+            self.Metrics = metrics.Metrics()
+        return self.Metrics
+
+    def disable_metrics(self):
+        collected = self.Metrics
+        self.Metrics = None
+        return collected
 
     def is_initialized(self):
         return self.Identified
@@ -307,38 +535,101 @@ class IO:
         print('Manufacturer:\t', self.Manufacturer)
         print('')
 
+    # Scans every block for the factory bad block marker and returns the bad ones
     def check_bad_blocks(self):
-    # """
-    # Iterates through the entire flash memory to find bad block.
-    # - Goes to each block from 0 to self.BlockCount
-    # - Reads the OOB part. If the byte is not 0xff ,the block is bad
-    # (every location in first page of bad block is marked with anything besides 0xff)
-    # """
-        bad_blocks = list()
-
-        first_page_idx = 0
-        for block_idx in range(0, self.BlockCount):
-
-            first_page_data = self.read_page(first_page_idx)
-
-            # the first byte in spare area of first page is not 0xff if bad block
-            if first_page_data[self.PageSize] != b'\xff':
-                print('Bad block found:', block_idx)
-                bad_blocks.append(block_idx)
-
-            first_page_idx += self.PagePerBlock
+        bad_blocks = self.scan_bad_blocks()
+        for block_idx in bad_blocks:
+            print('Bad block found:', block_idx)
 
         print('Checked %d blocks and found %d bad blocks' % (self.BlockCount, len(bad_blocks)))
         return bad_blocks
 
+    # Reads only the factory bad block marker, the first spare byte of the pages in
+    # .. marker_pages (offsets in the block, negative from the end), of every block in
+    # .. 'blocks' (default all). With WaitOnIO batch pages go out as one transaction,
+    # .. otherwise LunScheduler keeps every LUN busy, or with a single LUN the pages
+    # .. are read one by one. Returns the sorted bad blocks
+    def scan_bad_blocks(self, blocks = None, marker_pages = (0, -1), batch = 256):
+        blocks = range(self.BlockCount) if blocks is None else blocks
+        pagenos = [block * self.PagePerBlock + (offset % self.PagePerBlock) for block in blocks for offset in marker_pages]
+        markers = bytearray()
+
+        if self.WaitOnIO:
+            for start in range(0, len(pagenos), batch):
+                txn = self.__transaction()
+                for pageno in pagenos[start:start + batch]:
+                    txn.command(flashdevice_defs.NAND_CMD_READ0).address(self.page_address(pageno, self.PageSize), self.AddrCycles).command(flashdevice_defs.NAND_CMD_READSTART)
+                    txn.wait_ready().data_out(1)
+                markers += self.__submit(txn)
+        elif self.LUNS > 1:
+            sched = scheduler.LunScheduler(self)
+            tickets = [sched.read(pageno, column = self.PageSize, length = 1) for pageno in pagenos]
+            results = sched.run()
+            for ticket in tickets:
+                markers += results[ticket]
+        else:
+            for pageno in pagenos:
+                txn = self.__transaction()
+                txn.command(flashdevice_defs.NAND_CMD_READ0).address(self.page_address(pageno, self.PageSize), self.AddrCycles).command(flashdevice_defs.NAND_CMD_READSTART)
+                markers += self.__execute(txn, self.tRMax, data_out = 1, read = True)
+
+        return sorted(set(pageno // self.PagePerBlock for pageno, marker in zip(pagenos, markers) if marker != 0xff))
+
+    # UniqueID, read with read_unique_id the first time it is needed
+    def get_unique_id(self):
+        if self.UniqueID is None:
+            self.UniqueID = self.read_unique_id()
+        return self.UniqueID
+
+    # READ UNIQUE ID (EDh): returns the 16 byte unique ID as a hex string, or None
+    # .. if the part has no unique ID or no copy passes the complement check.
+    # .. Only the first of the 16 copies is read unless it fails the check
+    def read_unique_id(self):
+        if not self.OptionalCommands & flashdevice_defs.ONFI_OPT_CMD_READ_UNIQUE_ID:
+            return None
+
+        txn = self.__transaction()
+        txn.command(flashdevice_defs.NAND_CMD_READ_UNIQUE_ID).address(0, 1)
+        data = self.__execute(txn, self.tRMax, data_out = 32, read = True)
+        if not self.__valid_unique_id(data):
+            # the other copies follow in the same data output
+            data = data[32:] + self.__submit(self.__transaction().data_out(32 * 15))
+        for copy in range(0, len(data), 32):
+            if self.__valid_unique_id(data[copy:copy + 32]):
+                return data[copy:copy + 16].hex()
+        return None
+
+    # One 32 byte copy: the unique ID followed by its complement
+    @staticmethod
+    def __valid_unique_id(copy):
+        return len(copy) == 32 and all(a ^ b == 0xff for a, b in zip(copy[:16], copy[16:]))
+
+    # Bad block table of this chip, kept in BadBlockTableDir/<unique id>.json so it is
+    # .. only scanned once per chip. Parts without a unique ID are scanned every time
+    def get_bad_blocks(self, rescan = False):
+        unique_id = self.get_unique_id()
+        path = os.path.join(self.BadBlockTableDir, unique_id + '.json') if unique_id else None
+        if path and not rescan and os.path.exists(path):
+            with open(path) as fd:
+                table = json.load(fd)
+            if table.get('block_count') == self.BlockCount and table.get('page_per_block') == self.PagePerBlock:
+                return table['bad_blocks']
+
+        bad_blocks = self.scan_bad_blocks()
+        if path:
+            os.makedirs(self.BadBlockTableDir, exist_ok = True)
+            with open(path + '.tmp', 'w') as fd:
+                json.dump({'unique_id': unique_id, 'model': self.IDString.rstrip(), 'block_count': self.BlockCount,
+                           'page_per_block': self.PagePerBlock, 'bad_blocks': bad_blocks}, fd)
+            os.replace(path + '.tmp', path)
+        return bad_blocks
+
     def read_oob(self, pageno):
         bytes_to_send = bytearray()
         if self.Options & flashdevice_defs.LP_OPTIONS:
-            self.__send_cmd(flashdevice_defs.NAND_CMD_READ0)
-            self.__send_address((pageno<<16), self.AddrCycles)
-            self.__send_cmd(flashdevice_defs.NAND_CMD_READSTART)
-            self.__wait_ready()
-            bytes_to_send += self.__read_data(self.OOBSize)
+            txn = self.__transaction()
+            txn.command(flashdevice_defs.NAND_CMD_READ0).address(self.page_address(pageno), self.AddrCycles).command(flashdevice_defs.NAND_CMD_READSTART)
+            bytes_to_send += self.__execute(txn, self.tRMax, data_out = self.OOBSize, read = True)
         else:
             self.__send_cmd(flashdevice_defs.NAND_CMD_READ_OOB)
             self.__wait_ready()
@@ -357,33 +648,44 @@ class IO:
         self.__send_address(column_address,self.ColumnCycles)
         self.__send_cmd(flashdevice_defs.NAND_CMD_CHANGE_READ_COLUMN2)
 
-    def read_page_bytewise(self,pageno, remove_oob = False):
+    # Reads every byte of the page register with its own change read column.
+    # .. 'window' bytes worth of 05h-column-E0h-read sequences are sent as one
+    # .. USB transfer and read back in bulk; window = 1 is one round trip per byte.
+    # .. Inside a window tCCS and tRHW are kept with no-op opcodes (see mpsse.delay)
+    def read_page_bytewise(self,pageno, remove_oob = False, window = 0x200):
         length = (self.PageSize) if remove_oob else (self.RawPageSize)
-        bytes_to_read = []
+        bytes_to_read = bytearray()
 
-        self.__send_cmd(flashdevice_defs.NAND_CMD_READ0)
-        self.__send_address(pageno<<(8*self.ColumnCycles), self.AddrCycles)
-        self.__send_cmd(flashdevice_defs.NAND_CMD_READSTART)
+        txn = self.__transaction()
+        txn.command(flashdevice_defs.NAND_CMD_READ0).address(self.page_address(pageno), self.AddrCycles).command(flashdevice_defs.NAND_CMD_READSTART)
+        self.__execute(txn, self.tRMax, read = True)
 
-        for each_byte in range(length):
-            self.change_read_column(each_byte)
-            bytes_to_read += self.__read_data(1)
+        if self.ftdi is None or not self.ftdi.is_connected:
+            return []
 
-        return bytes_to_read
+        for column in range(0, length, window):
+            count = min(window, length - column)
+            # 05h-address-E0h per byte
+            bytes_to_read += self.__transfer(mpsse.encode_column_scan(column, count, self.ColumnCycles, self.tCCSMin), count,
+                                             (flashdevice_defs.NAND_CMD_RNDOUT, flashdevice_defs.NAND_CMD_RNDOUTSTART) * count)
+
+        return list(bytes_to_read)
 
     # This function will read page indexed 'pageno'
     # .. the index of the page is in global scope
     def read_page(self, pageno, read_chunk = 0x1000, remove_oob = False):
+        length = (self.PageSize) if remove_oob else (self.RawPageSize)
+        self.report_progress("Reading page", pageno, self.PageCount)
+        return self.__read_page_data(pageno, length, read_chunk)
 
+    def __read_page_data(self, pageno, length, read_chunk):
         bytes_to_read = []
 
-        length = (self.PageSize) if remove_oob else (self.RawPageSize)
-        print(f"I: Reading page {pageno}, {length} bytes")
-        self.__send_cmd(flashdevice_defs.NAND_CMD_READ0)
-        self.__send_address(pageno<<(8*self.ColumnCycles), self.AddrCycles)
-        self.__send_cmd(flashdevice_defs.NAND_CMD_READSTART)
+        txn = self.__transaction()
+        txn.command(flashdevice_defs.NAND_CMD_READ0).address(self.page_address(pageno), self.AddrCycles).command(flashdevice_defs.NAND_CMD_READSTART)
 
         if self.PageSize > read_chunk:
+            self.__execute(txn, self.tRMax, read = True)
             while length > 0:
                 read_len = read_chunk
                 if length < read_chunk:
@@ -391,7 +693,7 @@ class IO:
                 bytes_to_read += self.__read_data(read_len)
                 length -= read_chunk
         else:
-            bytes_to_read = self.__read_data(length)
+            bytes_to_read = self.__execute(txn, self.tRMax, data_out = length, read = True)
 
         return bytes_to_read
 
@@ -401,49 +703,45 @@ class IO:
         return self.read_page(page_no_to_read,read_chunk,remove_oob)
 
     #  this function uses chanage read colum feature to read each byte of a page from cache memory
-    def read_page_from_block_bytewise(self, pageno, blockno = 0, remove_oob = False):
+    def read_page_from_block_bytewise(self, pageno, blockno = 0, remove_oob = False, window = 0x200):
         page_no_to_read = blockno*self.PagePerBlock+pageno
-        return self.read_page_bytewise(page_no_to_read,remove_oob)
+        return self.read_page_bytewise(page_no_to_read,remove_oob,window)
 
     def write_block_get_ber(self, block_idx):
         """Writes random data to all pages in specified block and then compares data written to data intended to be written."""
-        random_data = utils.create_array("random", self.PageSize, filename="input.bin").tolist()
-        input_data = "".join(map(chr, random_data))
+        import utils
+        input_data = utils.create_array("random", self.PageSize, filename="input.bin")
 
         # self.write_block(block_idx, input_data, per_page=True)
         self.write_all_pages_in_a_block(block_idx, input_data)
 
         output_data = self.read_block(block_idx, remove_oob=True, comparison_file="input.bin", compare_per_page=True)
-        np.array(output_data, dtype=np.uint8).tofile("output.bin");
+        with open("output.bin", "wb") as fd:
+            fd.write(bytes(output_data))
 
-        pages=[]
-        ber=[]
+        # the report accumulates over calls, plot the latest pass over this block
+        # .. (shown, or saved to a file in headless mode, see report.py)
+        import report
+        return report.plot_page_ber(self.IDString.rstrip() + "_BER.txt", block_idx, self.PagePerBlock)
 
-        with open(self.IDString.rstrip() + "_BER.txt", "r") as error_data:
-            plot = csv.reader(error_data, delimiter=",")
-            for row in plot:
-                pages.append(row[1])
-                ber.append(row[2])
+    def read_block(self, blockno, remove_oob = False, comparison_file="", compare_per_page=False, accumulator = None, pe_cycle = None, pattern = None, store = None):
+        """Return data stored in all pages in specified block, computing the bit error rate if a comparison input is specified.
 
-        pyplot.plot(pages,ber)
-        pyplot.xlabel("Page")
-        pyplot.ylabel("Block Error Rate")
-        pyplot.title("BER per Page")
-        pyplot.show()
-
-    def read_block(self, blockno, remove_oob = False, comparison_file="", compare_per_page=False):
-        """Return data stored in all pages in specified block, computing the bit error rate if a comparison input is specified."""
+        Each page's bit error rate is appended to <IDString>_BER.txt as block,page,ber. Pass a ber.BerAccumulator
+        to also collect running statistics over many calls, tagged with pe_cycle and pattern, and a
+        resultstore.ResultStore to append the per-page bit errors to it.
+        """
         bytes_read = []
 
         # Prepare to write BER report if required
         if comparison_file:
-            cf = open(comparison_file,'rb')
-            comparison_input = cf.read()
-            cf.close()
-
-            output_file = open(self.IDString.rstrip()  + "_BER.txt", "w")
-
-            page_offset = 0
+            import ber
+            comparison_input = ber.as_array(comparison_file)
+            if accumulator is None:
+                accumulator = ber.BerAccumulator(self.PageSize if remove_oob else self.RawPageSize)
+            output_file = open(self.IDString.rstrip()  + "_BER.txt", "a")
+            page_bits = []
+            bits_compared = []
 
         # Begin processing pages
         for pageno in range(0, self.PagePerBlock, 1):
@@ -452,41 +750,143 @@ class IO:
             bytes_read += page_read
 
             if comparison_file:
-                ber = 0.0
+                read_offset = 0 if compare_per_page else pageno * len(page_read)
+                expected = comparison_input[read_offset:read_offset + len(page_read)]
+                bits = accumulator.add(expected, bytes(page_read), blockno, pageno, pe_cycle, pattern)
+                page_ber = bits / (len(expected) * 8) if len(expected) else 0.0
+                page_bits.append(bits)
+                bits_compared.append(len(expected) * 8)
 
-                if remove_oob:
-                    page_offset += self.PageSize
-                else:
-                    page_offset += self.PageSize + self.OOBSize
+                output_file.write(f"{blockno},{pageno},{page_ber}\n")
 
-                if compare_per_page:
-                    read_offset = 0
-                else:
-                    read_offset = page_offset
+        if comparison_file:
+            output_file.close()
+            if store is not None:
+                import resultstore
+                store.append(resultstore.chip_name(self), blockno, pe_cycle or 0, pattern or '', range(len(page_bits)), page_bits, bits_compared)
 
-                for idx,each_byte in enumerate(page_read):
-                    if(compare_per_page and each_byte != comparison_input[idx + read_offset]):
-                        ber += 1
+        return bytes_read
 
-                ber /= len(page_read)
+    # Streams blocks start_block..end_block (inclusive) into 'path', pre-sized and
+    # .. memory mapped so pages land in place. Progress is checkpointed after every
+    # .. block to '<path>.progress'; calling dump again with the same arguments resumes
+    # .. from there. Blocks with a factory bad block marker in the first or last page
+    # .. are listed in the result and, with skip_bad_blocks, left zero filled.
+    def dump(self, path, start_block = 0, end_block = -1, remove_oob = False, skip_bad_blocks = True, read_chunk = 0x10000):
+        if end_block == -1:
+            end_block = self.BlockCount - 1
+        if not 0 <= start_block <= end_block < self.BlockCount:
+            raise ValueError(f"dump needs 0 <= start_block <= end_block < {self.BlockCount}, got blocks {start_block}..{end_block}")
+
+        page_len = self.PageSize if remove_oob else self.RawPageSize
+        block_len = page_len * self.PagePerBlock
+        total_len = block_len * (end_block - start_block + 1)
+        progress_path = path + '.progress'
+        settings = {'id': self.IDString, 'start_block': start_block, 'end_block': end_block, 'page_len': page_len}
+
+        progress = {'settings': settings, 'next_block': start_block, 'bad_blocks': []}
+        if os.path.exists(progress_path) and os.path.exists(path) and os.path.getsize(path) == total_len:
+            with open(progress_path, 'r') as fd:
+                saved = json.load(fd)
+            if saved.get('settings') == settings:
+                progress = saved
+
+        with open(path, 'r+b' if progress['next_block'] != start_block else 'w+b') as fd:
+            fd.truncate(total_len)
+            out = mmap.mmap(fd.fileno(), total_len)
 
-                output_file.write(f"{blockno},{pageno},{ber}\n")
+        start = time.time()
+        length = 0
+        try:
+            for block in range(progress['next_block'], end_block + 1):
+                block_offset = (block - start_block) * block_len
+                first_page = block * self.PagePerBlock
+                last_page = first_page + self.PagePerBlock - 1
+
+                for pageno in range(first_page, last_page + 1):
+                    # the marker sits in the spare area, fetch it even when it is not kept
+                    marker_page = pageno in (first_page, last_page)
+                    page_data = self.__read_page_data(pageno, self.RawPageSize if marker_page else page_len, read_chunk)
+                    if marker_page and page_data[self.PageSize] != 0xff:
+                        if block not in progress['bad_blocks']:
+                            progress['bad_blocks'].append(block)
+                        if skip_bad_blocks:
+                            out[block_offset:block_offset + block_len] = bytes(block_len)
+                            break
+                    page_offset = block_offset + (pageno - first_page) * page_len
+                    out[page_offset:page_offset + page_len] = bytes(page_data[:page_len])
+                    length += page_len
+
+                progress['next_block'] = block + 1
+                # mmap.flush wants a page aligned start
+                flush_start = block_offset - block_offset % mmap.PAGESIZE
+                out.flush(flush_start, block_offset + block_len - flush_start)
+                with open(progress_path + '.tmp', 'w') as fd:
+                    json.dump(progress, fd)
+                os.replace(progress_path + '.tmp', progress_path)
+                self.report_progress("Dumping block", block - start_block + 1, end_block - start_block + 1)
+        finally:
+            out.close()
+
+        os.remove(progress_path)
+        lapsed_time = max(time.time() - start, 1e-9)
+        result = {'path': path, 'bytes': length, 'seconds': lapsed_time, 'mb_per_s': length / lapsed_time / 1e6, 'bad_blocks': progress['bad_blocks']}
+        print('Dumped %d bytes in %.1f s (%.2f MB/s), %d bad blocks' % (length, lapsed_time, result['mb_per_s'], len(result['bad_blocks'])))
+        return result
+
+    # Yields (pageno, data) for pages start_page..end_page (inclusive). When the
+    # .. parameter page advertises the read cache commands, page N+1 is sensed
+    # .. (31h, or 00h-address-31h across a block boundary) while page N is
+    # .. transferred, and 3Fh ends the sequence; otherwise pages are read one by one.
+    # .. READ CACHE RANDOM stays within a LUN, so the sequence also ends with 3Fh on
+    # .. the last page of a LUN and starts again with 00h-address-30h in the next one
+    def read_pages_cached(self, start_page, end_page, remove_oob = False):
+        length = (self.PageSize) if remove_oob else (self.RawPageSize)
 
-        return bytes_read
+        if not self.OptionalCommands & flashdevice_defs.ONFI_OPT_CMD_READ_CACHE:
+            for pageno in range(start_page, end_page + 1):
+                yield pageno, bytes(self.__read_page_data(pageno, length, length))
+            return
 
-    # 
+        txn = self.__transaction()
+        txn.command(flashdevice_defs.NAND_CMD_READ0).address(self.page_address(start_page), self.AddrCycles).command(flashdevice_defs.NAND_CMD_READSTART)
+        self.__execute(txn, self.tRMax, read = True)
+
+        pageno = start_page
+        # set once 3Fh went out, so closing the generator does not send it again
+        ended = False
+        try:
+            while pageno <= end_page:
+                last = pageno == end_page or self.lun_of(pageno + 1) != self.lun_of(pageno)
+                txn = self.__transaction()
+                if last:
+                    txn.command(flashdevice_defs.NAND_CMD_READ_CACHE_END)
+                elif (pageno + 1) % self.PagePerBlock:
+                    txn.command(flashdevice_defs.NAND_CMD_READ_CACHE_SEQ)
+                else:
+                    txn.command(flashdevice_defs.NAND_CMD_READ0).address(self.page_address(pageno + 1), self.AddrCycles).command(flashdevice_defs.NAND_CMD_READ_CACHE_SEQ)
+                data = self.__execute(txn, data_out = length, read = True)
+                ended = last
+                if last and pageno < end_page:
+                    txn = self.__transaction()
+                    txn.command(flashdevice_defs.NAND_CMD_READ0).address(self.page_address(pageno + 1), self.AddrCycles).command(flashdevice_defs.NAND_CMD_READSTART)
+                    self.__execute(txn, self.tRMax, read = True)
+                yield pageno, data
+                pageno += 1
+        finally:
+            if not ended and self.ftdi is not None and self.ftdi.is_connected:
+                # abandoned early: leave cache read mode
+                self.__execute(self.__transaction().command(flashdevice_defs.NAND_CMD_READ_CACHE_END), self.tRMax, read = True)
+
+    # Reads the PagePerBlock pages starting at 'pageno' as one str
     def read_seq(self, pageno, remove_oob = False, raw_mode = False):
-        page = []
-        self.__send_cmd(flashdevice_defs.NAND_CMD_READ0)
-        self.__wait_ready()
-        self.__send_address(pageno<<8, self.AddrCycles)
-        self.__wait_ready()
+        if self.ftdi is None or not self.ftdi.is_connected:
+            return ''
 
+        page = bytearray()
         bad_block = False
 
-        for i in range(0, self.PagePerBlock, 1):
-            page_data = self.__read_data(self.RawPageSize)
-
+        for i, (_, page_data) in enumerate(self.read_pages_cached(pageno, pageno + self.PagePerBlock - 1)):
             if i in (0, 1):
                 if page_data[self.PageSize + 5] != 0xff:
                     bad_block = True
@@ -496,38 +896,187 @@ class IO:
             else:
                 page += page_data
 
-            self.__wait_ready()
-
-        if self.ftdi is None or not self.ftdi.is_connected:
-            return ''
-
-        self.ftdi.write_data(Array('B', [ftdi.Ftdi.SET_BITS_HIGH, 0x1, 0x1]))
-        self.ftdi.write_data(Array('B', [ftdi.Ftdi.SET_BITS_HIGH, 0x0, 0x1]))
-
-        data = ''
-
         if bad_block and not raw_mode:
             print('\nSkipping bad block at %d' % (pageno / self.PagePerBlock))
-        else:
-            for ch in page:
-                data += chr(ch)
+            return ''
 
-        return data
+        return page.decode('latin-1')
 
     # This function erases a block based on the index of page 'pageno'
     # .. pageno is the index in global scope
     def erase_block_by_page(self, pageno):
         self.WriteProtect = False
-        self.__send_cmd(flashdevice_defs.NAND_CMD_ERASE1)
-        # self.__send_address(pageno, self.AddrCycles)
-        self.__send_address(pageno, 3)
-        self.__send_cmd(flashdevice_defs.NAND_CMD_ERASE2)
-        self.__wait_ready()
-        err = self.__get_status()
+        txn = self.__transaction()
+        # txn.address(pageno, self.AddrCycles)
+        txn.command(flashdevice_defs.NAND_CMD_ERASE1).address(self.row_address(pageno), 3).command(flashdevice_defs.NAND_CMD_ERASE2)
+        err = self.__execute(txn, self.tBERSMax, status = True)[0]
+        self.WriteProtect = True
+
+        return err
+
+    # Non-blocking primitives for interleaving LUNs (see scheduler.py): each one
+    # .. only issues the operation, completion is polled with lun_status.
+    # .. Program and erase leave WP# released until the caller sets WriteProtect again
+    def start_read(self, pageno, column = 0):
+        txn = self.__transaction()
+        txn.command(flashdevice_defs.NAND_CMD_READ0).address(self.page_address(pageno, column), self.AddrCycles).command(flashdevice_defs.NAND_CMD_READSTART)
+        self.__submit(txn)
+
+    def start_program(self, pageno, data):
+        self.WriteProtect = False
+        txn = self.__transaction()
+        txn.command(flashdevice_defs.NAND_CMD_SEQIN).address(self.page_address(pageno), self.AddrCycles)
+        txn.data_in(data).command(flashdevice_defs.NAND_CMD_PAGEPROG)
+        self.__submit(txn)
+
+    def start_erase(self, pageno):
+        self.WriteProtect = False
+        txn = self.__transaction()
+        txn.command(flashdevice_defs.NAND_CMD_ERASE1).address(self.row_address(pageno), self.RowCycles).command(flashdevice_defs.NAND_CMD_ERASE2)
+        self.__submit(txn)
+
+    def lun_of(self, pageno):
+        return min(pageno // (self.BlockPerLUN * self.PagePerBlock), self.LUNS - 1)
+
+    # ONFI row address of page 'pageno', the page index over the whole target: page,
+    # .. block and LUN fields from the least significant bit, the page and block fields
+    # .. as wide as PagePerBlock and BlockPerLUN rounded up to a power of two
+    def row_address(self, pageno):
+        lun, page = divmod(pageno, self.BlockPerLUN * self.PagePerBlock)
+        block, page = divmod(page, self.PagePerBlock)
+        return (((lun << self.BlockAddressBits) | block) << self.PageAddressBits) | page
+
+    # Column and row address cycles of byte 'column' of page 'pageno', for AddrCycles
+    def page_address(self, pageno, column = 0):
+        return (self.row_address(pageno) << (8*self.ColumnCycles)) | column
+
+    def supports_status_enhanced(self):
+        return bool(self.OptionalCommands & flashdevice_defs.ONFI_OPT_CMD_READ_STATUS_ENHANCED)
+
+    # Status of the LUN of every page in 'pagenos' with READ STATUS ENHANCED (78h),
+    # .. all in one round trip. Without 78h a single page is polled with 70h.
+    # .. Returns one status byte per page
+    def lun_status(self, pagenos):
+        txn = self.__transaction()
+        if not self.supports_status_enhanced():
+            txn.command(flashdevice_defs.NAND_CMD_STATUS).data_out(1)
+            return self.__submit(txn) * len(pagenos)
+        for pageno in pagenos:
+            txn.command(flashdevice_defs.NAND_CMD_STATUS_ENHANCED).address(self.row_address(pageno), self.RowCycles).data_out(1)
+        return self.__submit(txn)
+
+    # 'length' bytes of data output, from the column given to start_read, of the page
+    # .. a completed start_read sensed: 78h selects its LUN and 00h returns it to data output
+    def read_lun_data(self, pageno, length):
+        txn = self.__transaction()
+        if self.supports_status_enhanced():
+            txn.command(flashdevice_defs.NAND_CMD_STATUS_ENHANCED).address(self.row_address(pageno), self.RowCycles)
+        txn.command(flashdevice_defs.NAND_CMD_READ0).data_out(length)
+        return self.__submit(txn)
+
+    # Splits 'blocks' into groups that multi-plane operations can take at once:
+    # .. ascending planes, same block address above the plane bits
+    def plane_groups(self, blocks):
+        groups = []
+        current = []
+        for block in blocks:
+            if current and (self.Planes == 1 or block >> self.PlaneAddressBits != current[0] >> self.PlaneAddressBits or block % self.Planes <= current[-1] % self.Planes):
+                groups.append(current)
+                current = []
+            current.append(block)
+        if current:
+            groups.append(current)
+        return groups
+
+    def supports_multi_plane(self, read = False):
+        feature = flashdevice_defs.ONFI_FEATURE_MULTI_PLANE_READ if read else flashdevice_defs.ONFI_FEATURE_MULTI_PLANE_PROG_ERASE
+        return self.Planes > 1 and bool(self.Features & feature)
+
+    # Erases one plane group (see plane_groups) with 60h-D1h per plane and 60h-D0h
+    # .. for the last, so all of them take one tBERS. Returns NAND_STATUS_FAIL if
+    # .. any block failed to erase, 0 otherwise
+    def erase_multi_plane(self, blocks):
+        if len(blocks) == 1 or not self.supports_multi_plane():
+            err = 0
+            for block in blocks:
+                err |= self.erase_block_by_page(block * self.PagePerBlock) & flashdevice_defs.NAND_STATUS_FAIL
+            return err
+
+        self.WriteProtect = False
+        txn = self.__transaction()
+        for block in blocks[:-1]:
+            txn.command(flashdevice_defs.NAND_CMD_ERASE1).address(self.row_address(block * self.PagePerBlock), self.RowCycles).command(flashdevice_defs.NAND_CMD_MULTIPLANE_ERASE)
+            txn = self.__step(txn)
+        txn.command(flashdevice_defs.NAND_CMD_ERASE1).address(self.row_address(blocks[-1] * self.PagePerBlock), self.RowCycles).command(flashdevice_defs.NAND_CMD_ERASE2)
+        err = self.__execute(txn, self.tBERSMax, status = True)[0] & flashdevice_defs.NAND_STATUS_FAIL
+        self.WriteProtect = True
+
+        return err
+
+    # Programs page 'pageno' (index inside the block) of every block in one plane
+    # .. group, pages[i] going to blocks[i], with 80h-11h per plane and 10h for the last.
+    # .. Returns NAND_STATUS_FAIL if any page failed to program, 0 otherwise
+    def write_multi_plane(self, pageno, blocks, pages):
+        if len(blocks) == 1 or not self.supports_multi_plane():
+            err = 0
+            for block, page_data in zip(blocks, pages):
+                err |= self.__program_page(block * self.PagePerBlock + pageno, page_data, status = True)[0] & flashdevice_defs.NAND_STATUS_FAIL
+            return err
+
+        self.WriteProtect = False
+        txn = self.__transaction()
+        for idx, (block, page_data) in enumerate(zip(blocks, pages)):
+            txn.command(flashdevice_defs.NAND_CMD_SEQIN).address(self.page_address(block * self.PagePerBlock + pageno), self.AddrCycles).data_in(page_data)
+            if idx < len(blocks) - 1:
+                txn = self.__step(txn.command(flashdevice_defs.NAND_CMD_MULTIPLANE_PROG))
+        txn.command(flashdevice_defs.NAND_CMD_PAGEPROG)
+        err = self.__execute(txn, self.tPROGMax, status = True)[0] & flashdevice_defs.NAND_STATUS_FAIL
         self.WriteProtect = True
 
         return err
 
+    # Reads page 'pageno' (index inside the block) of every block in one plane group
+    # .. with a single tR (00h-32h per plane, 00h-30h for the last), then selects each
+    # .. plane for data output with 06h-E0h, or 00h-05h-E0h on parts without it.
+    # .. Returns one page per block
+    def read_multi_plane(self, pageno, blocks, remove_oob = False):
+        length = (self.PageSize) if remove_oob else (self.RawPageSize)
+        if len(blocks) == 1 or not self.supports_multi_plane(read = True):
+            return [bytes(self.__read_page_data(block * self.PagePerBlock + pageno, length, length)) for block in blocks]
+
+        txn = self.__transaction()
+        for block in blocks[:-1]:
+            txn.command(flashdevice_defs.NAND_CMD_READ0).address(self.page_address(block * self.PagePerBlock + pageno), self.AddrCycles)
+            txn = self.__step(txn.command(flashdevice_defs.NAND_CMD_MULTIPLANE_READ))
+        txn.command(flashdevice_defs.NAND_CMD_READ0).address(self.page_address(blocks[-1] * self.PagePerBlock + pageno), self.AddrCycles).command(flashdevice_defs.NAND_CMD_READSTART)
+        self.__execute(txn, self.tRMax, read = True)
+
+        # every plane's data out in one transfer
+        txn = self.__transaction()
+        for block in blocks:
+            address = self.page_address(block * self.PagePerBlock + pageno)
+            if self.OptionalCommands & flashdevice_defs.ONFI_OPT_CMD_CHANGE_READ_COLUMN_ENHANCED:
+                txn.command(flashdevice_defs.NAND_CMD_CHANGE_READ_COLUMN_ENHANCED).address(address, self.AddrCycles)
+            else:
+                txn.command(flashdevice_defs.NAND_CMD_READ0).address(address, self.AddrCycles)
+                txn.command(flashdevice_defs.NAND_CMD_CHANGE_READ_COLUMN1).address(0, self.ColumnCycles)
+            txn.command(flashdevice_defs.NAND_CMD_CHANGE_READ_COLUMN2).data_out(length)
+        data = self.__submit(txn)
+        return [data[idx * length:(idx + 1) * length] for idx in range(len(blocks))]
+
+    # Programs every page of every block in 'blocks' with 'data', a plane group at a time.
+    # .. Returns the failure bits (NAND_STATUS_FAIL, NAND_STATUS_FAILC) of every page
+    # .. ORed together, 0 when all of them programmed
+    def write_all_pages_in_blocks(self, blocks, data):
+        err = 0
+        for group in self.plane_groups(blocks):
+            if len(group) == 1:
+                err |= self.write_all_pages_in_a_block(group[0], data)
+                continue
+            for pageno in range(self.PagePerBlock):
+                err |= self.write_multi_plane(pageno, group, [data] * len(group))
+        return err
+
     # This function can be used to set features
     # .. feature_address is the address of the feature to change
     # .. feature_values is a four-element list of hex values
@@ -535,65 +1084,219 @@ class IO:
         if len(feature_values) != 4:
             print(f"E: Error in Set Features. Please send a list of 4 feature values")
             sys.exit(-1)
-        self.__send_cmd(flashdevice_defs.NAND_CMD_SET_FEATURES)
-        self.__wait_ready()
-        self.__send_address(feature_address,1)
-        self.__wait_ready()
-        # we need a delay
-        time.sleep(0.05)
-        self.__write_data_bin(feature_values)
-
-        return
+        self.__set_features(feature_address, bytes(mpsse.as_buffer(feature_values)))
 
     def set_features(self, feature_address, feature_values):
         if len(feature_values) != 4:
             print(f"E: Error in Set Features. Please send a list of 4 feature values")
             sys.exit(-1)
-        self.__send_cmd(flashdevice_defs.NAND_CMD_SET_FEATURES)
-        self.__wait_ready()
-        self.__send_address(feature_address,1)
-        self.__wait_ready()
-        # we need a delay
-        time.sleep(0.05)
-        data = ''
+        self.__set_features(feature_address, bytes(each_val & 0xff for each_val in feature_values))
 
-        for each_val in feature_values:
-            data += chr(each_val & 0xff)
+    # SET FEATURES (EFh) and its four parameters in one transaction, then a wait for
+    # .. tFEAT. Skipped when the shadow already holds these values
+    def __set_features(self, feature_address, values):
+        if self.ShadowFeatures and self.FeatureShadow.get(feature_address) == values:
+            return
+        self.invalidate_features(feature_address)
+        txn = self.__transaction()
+        txn.command(flashdevice_defs.NAND_CMD_SET_FEATURES).address(feature_address, 1).data_in(values)
+        self.__execute(txn, self.tFEATMax)
+        self.__shadow_feature(feature_address, values)
 
-        self.__write(0, 0, data)
-        self.__wait_ready()
+    # Records the value the chip now holds, while ShadowFeatures is on
+    def __shadow_feature(self, feature_address, values):
+        if self.ShadowFeatures:
+            self.FeatureShadow[feature_address] = values
 
-        return
-# page_data = self.__read_data(self.RawPageSize)
-    
     #This function can be used to get feature values
     # .. feature address is the address of the feature address to read
-    # .. the return value is a four element array
+    # .. the return value is the four parameter bytes, from the shadow when known
     def get_features(self, feature_address):
-        self.__send_cmd(flashdevice_defs.NAND_CMD_GET_FEATURES)
-        self.__wait_ready()
-        self.__send_address(feature_address,1)
-        self.__wait_ready()
-        # we need a delay
-        time.sleep(0.05)
-        return self.__read_data(4)
+        if self.ShadowFeatures and feature_address in self.FeatureShadow:
+            return self.FeatureShadow[feature_address]
+        txn = self.__transaction()
+        txn.command(flashdevice_defs.NAND_CMD_GET_FEATURES).address(feature_address, 1)
+        values = self.__execute(txn, self.tFEATMax, data_out = 4, read = True)
+        self.__shadow_feature(feature_address, values)
+        return values
+
+    # Forgets the shadowed value of 'feature_address', or of every feature
+    def invalidate_features(self, feature_address = None):
+        if feature_address is None:
+            self.FeatureShadow.clear()
+        else:
+            self.FeatureShadow.pop(feature_address, None)
+
+    # RESET (FFh): returns every feature to its power-on value, so the shadow is cleared
+    # .. and the chip is back in timing mode 0
+    def reset(self):
+        self.__execute(self.__transaction().command(flashdevice_defs.NAND_CMD_RESET))
+        self.invalidate_features()
+        self.TimingMode = 0
+
+    # Switches the chip to asynchronous timing mode 'mode' (SET FEATURES 01h) and the
+    # .. FTDI clock to 12 MHz (slow) or 60 MHz, in the order that keeps every transfer
+    # .. within the timing of the slower setting. Returns whether transfers verify,
+    # .. or True without verify
+    def set_timing_mode(self, mode, slow = False, verify = True):
+        if not self.OptionalCommands & flashdevice_defs.ONFI_OPT_CMD_GET_SET_FEATURES:
+            print(f"E: Timing modes need GET/SET FEATURES, which this part does not support")
+            return False
+        if slow:
+            self.__set_clock(slow)
+        self.set_features(flashdevice_defs.ONFI_FEATURE_ADDR_TIMING_MODE, [mode, 0, 0, 0])
+        if not slow:
+            self.__set_clock(slow)
+        self.TimingMode = mode
+        return self.verify_transfer() if verify else True
+
+    # Reads the timing mode feature back from the chip and one copy of the parameter
+    # .. page, which must match the one read at identification
+    def verify_transfer(self):
+        self.invalidate_features(flashdevice_defs.ONFI_FEATURE_ADDR_TIMING_MODE)
+        values = self.get_features(flashdevice_defs.ONFI_FEATURE_ADDR_TIMING_MODE)
+        if not values or values[0] != self.TimingMode:
+            self.invalidate_features(flashdevice_defs.ONFI_FEATURE_ADDR_TIMING_MODE)
+            return False
+
+        txn = self.__transaction()
+        txn.command(flashdevice_defs.NAND_CMD_ONFI).address(0, 1)
+        data = self.__execute(txn, data_out = onfi.PARAMETER_PAGE_SIZE, read = True)
+        if self.ParameterPage is not None and self.ParameterPage.crc_valid:
+            return data == self.ParameterPage.raw
+        page = onfi.ParameterPage.from_copies(data)
+        return page is not None and page.crc_valid
+
+    # Runs the fastest timing mode the parameter page lists on the 60 MHz clock (12 MHz with
+    # .. do_slow) whose transfers verify, trying slower modes after a failure and finally
+    # .. mode 0 at 12 MHz. Returns the mode in use.
+    # .. With the parameter page cache the result is kept by JEDEC ID, and a later call
+    # .. with the same supported modes and clock sets that mode without verifying it again
+    def select_timing_mode(self):
+        if not self.OptionalCommands & flashdevice_defs.ONFI_OPT_CMD_GET_SET_FEATURES:
+            return self.TimingMode
+        cache_dir = self.ParameterPageCache
+        settings = {'timing_modes': self.TimingModes, 'do_slow': self.Slow}
+        # one record per supported modes and requested clock
+        records = onfi.load_timing_modes(cache_dir, self.JedecID) if cache_dir else []
+        known = next((record for record in records if record.get('settings') == settings), None)
+        if known is not None:
+            self.set_timing_mode(known['timing_mode'], known['slow'], verify = False)
+            return known['timing_mode']
+
+        modes = [mode for mode in range(self.TimingModes.bit_length() - 1, -1, -1) if self.TimingModes & (1 << mode)]
+        for mode in modes:
+            if self.set_timing_mode(mode, self.Slow):
+                print(f"I: Timing mode {mode}, FTDI clock {12 if self.Slow else 60} MHz")
+                break
+            print(f"I: Timing mode {mode} failed transfer verification")
+        else:
+            mode = 0
+            if not self.set_timing_mode(0, True):
+                print(f"E: Transfers do not verify even in timing mode 0 at 12 MHz")
+                return 0
+            print(f"I: Falling back to timing mode 0, FTDI clock 12 MHz")
+
+        if cache_dir:
+            records = [record for record in records if record.get('settings') != settings]
+            onfi.store_timing_modes(cache_dir, self.JedecID, records + [{'settings': settings, 'timing_mode': mode, 'slow': self.Slow}])
+        return mode
+
+    # Sets feature 'feature_address' to 'feature_values' and reads 'pagenos' under that
+    # .. setting, e.g. one read retry or read offset level. With WaitOnIO the feature write,
+    # .. its tFEAT wait and 'batch' page reads go out as one transaction, otherwise runs
+    # .. of consecutive pages are cache read (read_pages_cached) and other pages read one
+    # .. by one. Returns the page data in the order of pagenos
+    def read_pages_with_feature(self, feature_address, feature_values, pagenos, remove_oob = False, batch = 16):
+        length = self.PageSize if remove_oob else self.RawPageSize
+        values = bytes(each_val & 0xff for each_val in feature_values)
+
+        if not self.WaitOnIO:
+            self.__set_features(feature_address, values)
+            pages = []
+            start = 0
+            while start < len(pagenos):
+                end = start + 1
+                while end < len(pagenos) and pagenos[end] == pagenos[end - 1] + 1:
+                    end += 1
+                if end - start > 1:
+                    pages += [data for _, data in self.read_pages_cached(pagenos[start], pagenos[end - 1], remove_oob)]
+                else:
+                    pages.append(bytes(self.__read_page_data(pagenos[start], length, length)))
+                start = end
+            return pages
+
+        txn = self.__transaction()
+        set_feature = not (self.ShadowFeatures and self.FeatureShadow.get(feature_address) == values)
+        if set_feature:
+            # unknown until the transaction carrying the write went through
+            self.invalidate_features(feature_address)
+            txn.command(flashdevice_defs.NAND_CMD_SET_FEATURES).address(feature_address, 1).data_in(values).wait_ready()
+        pages = []
+        for start in range(0, max(1, len(pagenos)), batch):
+            for pageno in pagenos[start:start + batch]:
+                txn.command(flashdevice_defs.NAND_CMD_READ0).address(self.page_address(pageno), self.AddrCycles).command(flashdevice_defs.NAND_CMD_READSTART)
+                txn.wait_ready().data_out(length)
+            data = self.__submit(txn)
+            if set_feature:
+                self.__shadow_feature(feature_address, values)
+                set_feature = False
+            pages += [data[offset:offset + length] for offset in range(0, len(data), length)]
+            txn = self.__transaction()
+        return pages
 
     # this function write a page of flash memory
     # .. the pageno is index of page in global scope
-    def write_page(self, pageno, data):
+    # .. data can be bytes, bytearray, memoryview, a numpy uint8 array or a str of chr() values
+    # .. cache = True confirms with CACHE PROGRAM (15h): the call returns once the cache
+    # .. register is free while the array is still programming, the last page must use 10h
+    def write_page(self, pageno, data, cache = False):
         err = 0
+        self.__program_page(pageno, data, cache)
+        return err
+
+    def __program_page(self, pageno, data, cache = False, status = False):
         self.WriteProtect = False
 
-        self.__send_cmd(flashdevice_defs.NAND_CMD_SEQIN)
-        self.__wait_ready()
-        self.__send_address(pageno<<(8*self.ColumnCycles), self.AddrCycles)
-        self.__wait_ready()
-        self.__write_data(data)
-        self.__send_cmd(flashdevice_defs.NAND_CMD_PAGEPROG)
-        self.__wait_ready()
+        txn = self.__transaction()
+        txn.command(flashdevice_defs.NAND_CMD_SEQIN).address(self.page_address(pageno), self.AddrCycles)
+        txn.data_in(data).command(flashdevice_defs.NAND_CMD_CACHEDPROG if cache else flashdevice_defs.NAND_CMD_PAGEPROG)
+        result = self.__execute(txn, 0.0 if cache else self.tPROGMax, status = status)
 
         self.WriteProtect = True
-        return err
+        return result
+
+    # Programs the buffers in 'pages' to consecutive pages from start_page. With
+    # .. cache program support every page but the last is confirmed with 15h, so
+    # .. the transfer of page N+1 overlaps the programming of page N.
+    # .. The status is read after every page: after a 15h, NAND_STATUS_FAILC reports
+    # .. the page before, and NAND_STATUS_FAIL the page itself once the array is idle.
+    # .. Returns those failure bits ORed over the run, 0 when every page programmed
+    # .. (None without pages)
+    def write_pages_cached(self, start_page, pages):
+        use_cache = bool(self.OptionalCommands & flashdevice_defs.ONFI_OPT_CMD_CACHE_PROGRAM)
+        pageno = start_page
+        pending = None
+        err = 0
+
+        for page_data in pages:
+            if pending is not None:
+                err |= self.__program_failures(self.__program_page(pageno, pending, use_cache, status = True)[0], use_cache and pageno > start_page)
+                pageno += 1
+            pending = page_data
+
+        if pending is None:
+            return None
+        return err | self.__program_failures(self.__program_page(pageno, pending, status = True)[0], use_cache and pageno > start_page)
+
+    # Failure bits of a status read after a program: FAIL only counts once the array
+    # .. is idle, FAILC only when the previous page was cache programmed in this run
+    @staticmethod
+    def __program_failures(status, cached_previous):
+        mask = flashdevice_defs.NAND_STATUS_FAILC if cached_previous else 0
+        if status & flashdevice_defs.NAND_STATUS_IDLE:
+            mask |= flashdevice_defs.NAND_STATUS_FAIL
+        return status & mask
 
     def convert_to_SLC_mode(self, block_idx):
         to_set_features = [1,1,0,0]
@@ -613,8 +1316,7 @@ class IO:
         self.set_features(0x91,to_set_features)
 
     def write_all_pages_in_a_block(self,block_idx,data):
-        for each_pages in range(self.PagePerBlock):
-            self.write_page_in_a_block(each_pages, block_idx, data)
+        return self.write_pages_cached(block_idx*self.PagePerBlock, [data]*self.PagePerBlock)
 
     # this function write a page of flash memory
     # .. the pageno is index of page in block of index block_idx
@@ -638,7 +1340,6 @@ class IO:
         if end_page % self.PagePerBlock > 0:
             end_block += 1
 
-        start = time.time()
         ecc_calculator = ecc.Calculator()
 
         page = start_page
@@ -688,21 +1389,14 @@ class IO:
                 print('Not enough source data')
                 break
 
-            current = time.time()
-
-            if end_page == start_page:
-                progress = 100
+            self.report_progress("Writing page", page, end_page)
+            # 15h while the block and the source data continue, 10h to close them
+            if add_oob:
+                more_data = current_data_offset < len(data)
             else:
-                progress = (page-start_page) * 100 / (end_page-start_page)
-
-            lapsed_time = current-start
-
-            if lapsed_time > 0:
-                if self.UseAnsi:
-                    sys.stdout.write('Writing %d%% Page: %d/%d Block: %d/%d Speed: %d bytes/s\n\033[A' % (progress, page, end_page, block, end_block, length/lapsed_time))
-                else:
-                    sys.stdout.write('Writing %d%% Page: %d/%d Block: %d/%d Speed: %d bytes/s\n' % (progress, page, end_page, block, end_block, length/lapsed_time))
-            self.write_page(page, page_data)
+                more_data = current_data_offset + self.RawPageSize <= len(data)
+            cache = bool(self.OptionalCommands & flashdevice_defs.ONFI_OPT_CMD_CACHE_PROGRAM) and more_data and page < end_page and page%self.PagePerBlock != self.PagePerBlock-1
+            self.write_page(page, page_data, cache)
 
             if page%self.PagePerBlock == 0:
                 block = page / self.PagePerBlock
@@ -718,8 +1412,8 @@ class IO:
             self.erase_block_by_page(block * self.PagePerBlock)
             block += 1
 
+    # Erases start_block..end_block, a plane group at a time on multi-plane parts
     def erase_blocks(self, start_block, end_block):
-        print('Erasing Block: 0x%x ~ 0x%x' % (start_block, end_block))
-        for block in range(start_block, end_block+1, 1):
-            print("Erasing block", block)
-            self.erase_block_by_page(block * self.PagePerBlock)
+        for group in self.plane_groups(range(start_block, end_block+1, 1)):
+            self.report_progress("Erasing block", group[-1], end_block)
+            self.erase_multi_plane(group)
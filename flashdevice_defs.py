@@ -3,6 +3,19 @@ ADR_WP = 0x20
 ADR_CL = 0x40
 ADR_AL = 0x80
 
+# MPSSE opcodes used in MCU host bus emulation mode (same values as pyftdi.ftdi.Ftdi)
+MPSSE_SET_BITS_HIGH = 0x82
+MPSSE_GET_BITS_HIGH = 0x83
+MPSSE_SEND_IMMEDIATE = 0x87
+MPSSE_WAIT_ON_HIGH = 0x88
+MPSSE_WAIT_ON_LOW = 0x89
+MPSSE_DISABLE_CLK_DIV5 = 0x8a
+MPSSE_ENABLE_CLK_DIV5 = 0x8b
+MPSSE_READ_SHORT = 0x90
+MPSSE_READ_EXTENDED = 0x91
+MPSSE_WRITE_SHORT = 0x92
+MPSSE_WRITE_EXTENDED = 0x93
+
 NAND_CMD_READ0 = 0
 NAND_CMD_READ1 = 1
 NAND_CMD_RNDOUT = 5
@@ -11,11 +24,13 @@ NAND_CMD_READ_OOB = 0x50
 NAND_CMD_ERASE1 = 0x60
 NAND_CMD_STATUS = 0x70
 NAND_CMD_STATUS_MULTI = 0x71
+NAND_CMD_STATUS_ENHANCED = 0x78
 NAND_CMD_SEQIN = 0x80
 NAND_CMD_RNDIN = 0x85
 NAND_CMD_READID = 0x90
 NAND_CMD_ERASE2 = 0xd0
 NAND_CMD_PARAM = 0xec
+NAND_CMD_READ_UNIQUE_ID = 0xed
 NAND_CMD_RESET = 0xff
 NAND_CMD_LOCK = 0x2a
 NAND_CMD_UNLOCK1 = 0x23
@@ -31,12 +46,38 @@ NAND_CMD_SET_FEATURES = 0xef
 NAND_CMD_GET_FEATURES = 0xee
 NAND_CMD_CHANGE_READ_COLUMN1 = 0x05
 NAND_CMD_CHANGE_READ_COLUMN2 = 0xe0
+NAND_CMD_READ_CACHE_SEQ = 0x31
+NAND_CMD_READ_CACHE_END = 0x3f
+NAND_CMD_MULTIPLANE_PROG = 0x11
+NAND_CMD_MULTIPLANE_READ = 0x32
+NAND_CMD_MULTIPLANE_ERASE = 0xd1
+NAND_CMD_CHANGE_READ_COLUMN_ENHANCED = 0x06
 
 NAND_STATUS_FAIL = (1<<0) # HIGH - FAIL,  LOW - PASS
+NAND_STATUS_FAILC = (1<<1) # HIGH - FAIL,  LOW - PASS, previous page of a cache program
 NAND_STATUS_IDLE = (1<<5) # HIGH - IDLE,  LOW - ACTIVE
 NAND_STATUS_READY = (1<<6) # HIGH - READY, LOW - BUSY
 NAND_STATUS_NOT_PROTECTED = (1<<7) # HIGH - NOT,   LOW - PROTECTED
 
+# ONFI parameter page, bytes 6-7: features supported
+ONFI_FEATURE_16BIT_BUS = (1<<0)
+ONFI_FEATURE_MULTI_LUN = (1<<1)
+ONFI_FEATURE_NON_SEQ_PROGRAM = (1<<2)
+ONFI_FEATURE_MULTI_PLANE_PROG_ERASE = (1<<3)
+ONFI_FEATURE_MULTI_PLANE_READ = (1<<6)
+
+# ONFI parameter page, bytes 8-9: optional commands supported
+ONFI_OPT_CMD_CACHE_PROGRAM = (1<<0)
+ONFI_OPT_CMD_READ_CACHE = (1<<1)
+ONFI_OPT_CMD_GET_SET_FEATURES = (1<<2)
+ONFI_OPT_CMD_READ_STATUS_ENHANCED = (1<<3)
+ONFI_OPT_CMD_COPYBACK = (1<<4)
+ONFI_OPT_CMD_READ_UNIQUE_ID = (1<<5)
+ONFI_OPT_CMD_CHANGE_READ_COLUMN_ENHANCED = (1<<6)
+
+# ONFI feature addresses
+ONFI_FEATURE_ADDR_TIMING_MODE = 0x01
+
 LP_OPTIONS = 1
 DEVICE_DESCRIPTIONS = [
     # name, ID, PageSize, ChipSizeMb, EraseSize, Options, AddrCycles
@@ -19,10 +19,10 @@ my_nand_instance.erase_blocks(0,0)
 # use the following function to write an arbitrary array into a page
 fd = open(input_file,'rb')
 data_read = fd.read()
-# the internal function want str() so we have to do following
-data = "".join(map(chr,data_read))
+fd.close()
 # following functions write page with idx 1 inside the block whose idx is 0
-my_nand_instance.write_page_in_a_block(1, 0, str(data))
+# .. bytes, bytearray, memoryview and numpy uint8 arrays are accepted as they are
+my_nand_instance.write_page_in_a_block(1, 0, data_read)
 
 # use the following function to read a page from a block
 # .. this function reads the bytes from cache in a chunk of 0x1000 which is default value
@@ -0,0 +1,131 @@
+# pylint: disable=invalid-name
+# pylint: disable=line-too-long
+"""Opt-in counters and latency histograms for IO.
+
+IO.Metrics is None by default and every hook is a single attribute test, so
+disabled metrics cost nothing measurable.  IO.enable_metrics() installs a
+Metrics object that counts NAND commands per opcode, USB writes, reads and
+bytes, ready polls, and records latency histograms of USB round trips,
+ready waits and array operations (tR, tPROG, tBERS, ...):
+
+    metrics = nand.enable_metrics()
+    nand.read_block(12)
+    metrics.histograms['tR'].percentile(0.99), metrics.gauges()
+    metrics.save('metrics.json')
+"""
+import json
+import os
+import time
+import flashdevice_defs
+
+# array operation timed by __execute, by the last command of the transaction
+OPERATIONS = {flashdevice_defs.NAND_CMD_READSTART: 'tR',
+              flashdevice_defs.NAND_CMD_READ_CACHE_SEQ: 'tRCBSY',
+              flashdevice_defs.NAND_CMD_READ_CACHE_END: 'tRCBSY',
+              flashdevice_defs.NAND_CMD_PAGEPROG: 'tPROG',
+              flashdevice_defs.NAND_CMD_CACHEDPROG: 'tCBSY',
+              flashdevice_defs.NAND_CMD_ERASE2: 'tBERS',
+              flashdevice_defs.NAND_CMD_SET_FEATURES: 'tFEAT',
+              flashdevice_defs.NAND_CMD_GET_FEATURES: 'tFEAT'}
+
+class Histogram:
+    """Latencies in power-of-two buckets of microseconds: bucket n holds
+    values below 2**n us.
+    """
+    __slots__ = ('buckets', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * 32
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, seconds):
+        self.buckets[min(31, int(seconds * 1e6).bit_length())] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        """Upper bound in seconds of the bucket holding the given fraction of samples."""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min((1 << bucket) / 1e6, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {'count': self.count, 'total': self.total, 'mean': self.mean, 'min': self.min, 'max': self.max,
+                'p50': self.percentile(0.5), 'p99': self.percentile(0.99),
+                'buckets_us': {str(1 << bucket): count for bucket, count in enumerate(self.buckets) if count}}
+
+class Metrics:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.perf_counter()
+        self.counters = {}
+        self.histograms = {}
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.usb_seconds = 0.0
+
+    def count(self, name, increment = 1):
+        self.counters[name] = self.counters.get(name, 0) + increment
+
+    def observe(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.add(seconds)
+
+    def commands(self, opcodes):
+        for opcode in opcodes:
+            name = f"cmd_{opcode:02x}"
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    # One USB exchange: 'written' bytes out, 'read' bytes back, 'seconds' from the
+    # .. write until the last byte was read
+    def usb(self, written, read, seconds):
+        self.count('usb_writes')
+        self.bytes_written += written
+        if read:
+            self.count('usb_reads')
+            self.bytes_read += read
+            self.observe('usb_round_trip', seconds)
+        else:
+            self.observe('usb_write', seconds)
+        self.usb_seconds += seconds
+
+    def gauges(self):
+        """Bytes/s over the time spent in USB transfers and over the wall clock."""
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        usb = max(self.usb_seconds, 1e-9)
+        return {'elapsed': elapsed, 'usb_busy': self.usb_seconds / elapsed,
+                'write_bytes_per_s': self.bytes_written / usb, 'read_bytes_per_s': self.bytes_read / usb,
+                'wall_write_bytes_per_s': self.bytes_written / elapsed, 'wall_read_bytes_per_s': self.bytes_read / elapsed}
+
+    def as_dict(self):
+        return {'counters': dict(self.counters), 'bytes_written': self.bytes_written, 'bytes_read': self.bytes_read,
+                'gauges': self.gauges(), 'histograms': {name: histogram.as_dict() for name, histogram in self.histograms.items()}}
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), indent = 1)
+
+    def save(self, path):
+        with open(path + '.tmp', 'w') as fd:
+            fd.write(self.to_json())
+        os.replace(path + '.tmp', path)
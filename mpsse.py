@@ -0,0 +1,187 @@
+# pylint: disable=invalid-name
+# pylint: disable=line-too-long
+"""MPSSE command stream encoding for the NAND bus.
+
+The FT2232 runs in MCU host bus emulation mode: every byte on the NAND bus
+is one READ_SHORT/WRITE_SHORT opcode, preceded by a *_EXTENDED opcode that
+latches the high address byte (CL/AL/WP lines).  The streams only depend on
+the transfer length and those flags, so they are built once as byte
+templates and reused; a write only has to drop the payload into every third
+byte of a copy of its template.
+"""
+import math
+from functools import lru_cache
+import flashdevice_defs
+
+# ONFI minimum delays between bus cycles that follow each other in one stream, in
+# .. seconds, at their timing mode 0 values (the longest). Cycles in separate USB
+# .. writes are always further apart than these
+T_ADL = 400e-9  # last address cycle to data input (80h, EFh)
+T_WHR = 120e-9  # command or address to data output (70h, 78h, 90h, ...)
+T_RHW = 200e-9  # data output to the next command
+T_WB = 200e-9   # command to R/B# low, so a wait must not sample R/B# earlier
+T_RR = 40e-9    # R/B# high to data output
+T_CCS = 500e-9  # change column setup, E0h to data output (when the parameter page gives none)
+
+# IO drives the high GPIO byte to this state on connect, so repeating it changes
+# .. nothing on the bus: a no-op that takes at least one 60 MHz MPSSE clock per byte
+GPIO_HIGH = bytes((flashdevice_defs.MPSSE_SET_BITS_HIGH, 0x0, 0x1))
+NOOP_SECONDS = len(GPIO_HIGH) / 60e6
+
+def cmd_type(cl, al, wp = False):
+    """Returns the high address byte for the given CL/AL/WP# line states."""
+    value = 0
+    if cl:
+        value |= flashdevice_defs.ADR_CL
+    if al:
+        value |= flashdevice_defs.ADR_AL
+    if wp:
+        value |= flashdevice_defs.ADR_WP
+    return value
+
+@lru_cache(maxsize = 64)
+def encode_read(address_high, count, send_immediate = True):
+    """Returns the command stream clocking 'count' bytes out of the NAND."""
+    if count <= 0:
+        return b''
+    stream = bytes((flashdevice_defs.MPSSE_READ_EXTENDED, address_high, 0)) + bytes((flashdevice_defs.MPSSE_READ_SHORT, 0)) * (count - 1)
+    if send_immediate:
+        stream += bytes((flashdevice_defs.MPSSE_SEND_IMMEDIATE,))
+    return stream
+
+@lru_cache(maxsize = 64)
+def _write_template(address_high, count):
+    return bytes((flashdevice_defs.MPSSE_WRITE_EXTENDED, address_high, 0, 0)) + bytes((flashdevice_defs.MPSSE_WRITE_SHORT, 0, 0)) * (count - 1)
+
+@lru_cache(maxsize = 64)
+def delay(seconds):
+    """Returns no-op opcodes holding the bus cycles around them at least 'seconds' apart."""
+    if seconds <= 0:
+        return b''
+    return GPIO_HIGH * math.ceil(round(seconds / NOOP_SECONDS, 6))
+
+def as_buffer(data):
+    """Returns 'data' as a flat byte buffer, copying only when unavoidable.
+
+    Accepts bytes, bytearray, memoryview, mmap, array('B'), NumPy uint8
+    arrays, lists of ints and, for older callers, str holding one byte per
+    character.
+    """
+    if isinstance(data, (bytes, bytearray)):
+        return data
+    if isinstance(data, str):
+        return data.encode('latin-1')
+    try:
+        view = memoryview(data)
+    except TypeError:
+        return bytes(data)
+    if view.itemsize != 1:
+        # wider items are byte values stored in a wider type, not raw memory
+        return bytes(view.tolist())
+    if not view.contiguous:
+        return view.tobytes()
+    return view if view.format == 'B' and view.ndim == 1 else view.cast('B')
+
+def encode_write(address_high, data):
+    """Returns the command stream clocking 'data' (see as_buffer) into the NAND."""
+    data = as_buffer(data)
+    count = len(data)
+    if count <= 0:
+        return bytearray()
+    stream = bytearray(_write_template(address_high, count))
+    stream[3::3] = data
+    return stream
+
+@lru_cache(maxsize = 256)
+def encode_column_scan(start, count, column_cycles, t_ccs = T_CCS):
+    """Returns one stream reading columns start..start+count-1 of the page
+    register one byte at a time, each preceded by CHANGE READ COLUMN
+    (05h, column address, E0h).  Every E0h is followed by t_ccs seconds of
+    no-ops before its byte is read, and every read by tRHW before the next
+    05h.  Read back 'count' bytes afterwards.
+    """
+    if count <= 0:
+        return b''
+    address_high_cl = cmd_type(1, 0)
+    address_high_al = cmd_type(0, 1)
+    segment = bytes((flashdevice_defs.MPSSE_WRITE_EXTENDED, address_high_cl, 0, flashdevice_defs.NAND_CMD_CHANGE_READ_COLUMN1,
+                     flashdevice_defs.MPSSE_WRITE_EXTENDED, address_high_al, 0, 0))
+    segment += bytes((flashdevice_defs.MPSSE_WRITE_SHORT, 0, 0)) * (column_cycles - 1)
+    segment += bytes((flashdevice_defs.MPSSE_WRITE_EXTENDED, address_high_cl, 0, flashdevice_defs.NAND_CMD_CHANGE_READ_COLUMN2))
+    segment += delay(t_ccs) + bytes((flashdevice_defs.MPSSE_READ_EXTENDED, 0, 0)) + delay(T_RHW)
+    stream = bytearray(segment * count)
+    columns = range(start, start + count)
+    for cycle in range(column_cycles):
+        # column address cycles go out least significant byte first
+        stream[7 + 3 * cycle::len(segment)] = bytes((column >> (8 * cycle)) & 0xff for column in columns)
+    stream.append(flashdevice_defs.MPSSE_SEND_IMMEDIATE)
+    return bytes(stream)
+
+def clear_cache():
+    encode_read.cache_clear()
+    _write_template.cache_clear()
+    encode_column_scan.cache_clear()
+    delay.cache_clear()
+
+class Transaction:
+    """Collects a whole ONFI operation (commands, address cycles, data in,
+    R/B# waits, data out) into one MPSSE stream so it goes out as a single
+    USB write, with a single read for everything it clocks out.
+
+    Where one kind of cycle directly follows another, the stream holds
+    them apart by the ONFI minimum (tADL, tWHR, tCCS after E0h, tRHW, tWB,
+    tRR) with no-ops, see delay.  t_ccs is the part's tCCS.
+    """
+    def __init__(self, write_enable = False, t_ccs = T_CCS):
+        self.wp = write_enable
+        self.t_ccs = t_ccs
+        self.stream = bytearray()
+        self.read_count = 0
+        self.commands = []
+        # kind of the last cycle in the stream: 'command', 'address', 'data_in', 'data_out' or 'wait'
+        self.last = None
+
+    def command(self, cmd):
+        if self.last == 'data_out':
+            self.stream += delay(T_RHW)
+        self.commands.append(cmd)
+        self.stream += encode_write(cmd_type(1, 0, self.wp), bytes((cmd,)))
+        self.last = 'command'
+        return self
+
+    def address(self, addr, count):
+        self.stream += encode_write(cmd_type(0, 1, self.wp), (addr & ((1 << (8*count)) - 1)).to_bytes(count, 'little'))
+        self.last = 'address'
+        return self
+
+    def data_in(self, data):
+        if self.last == 'address':
+            self.stream += delay(T_ADL)
+        self.stream += encode_write(cmd_type(0, 0, self.wp), data)
+        self.last = 'data_in'
+        return self
+
+    def data_out(self, count):
+        if self.last == 'command' and self.commands[-1] == flashdevice_defs.NAND_CMD_CHANGE_READ_COLUMN2:
+            self.stream += delay(self.t_ccs)
+        elif self.last in ('command', 'address'):
+            self.stream += delay(T_WHR)
+        elif self.last == 'wait':
+            self.stream += delay(T_RR)
+        self.stream += encode_read(cmd_type(0, 0, self.wp), count, send_immediate = False)
+        self.read_count += count
+        self.last = 'data_out'
+        return self
+
+    def wait_ready(self):
+        if self.last in ('command', 'data_in'):
+            self.stream += delay(T_WB)
+        # MPSSE holds further commands until I/O1 (wired to R/B#) is high
+        self.stream.append(flashdevice_defs.MPSSE_WAIT_ON_HIGH)
+        self.last = 'wait'
+        return self
+
+    def encode(self):
+        if self.read_count:
+            return self.stream + bytes((flashdevice_defs.MPSSE_SEND_IMMEDIATE,))
+        return self.stream
@@ -0,0 +1,610 @@
+# pylint: disable=invalid-name
+# pylint: disable=line-too-long
+"""In-memory ONFI NAND model and a simulated FT2232 transport.
+
+SimulatedFtdi implements the subset of pyftdi.ftdi.Ftdi that IO uses and
+decodes the MCU host bus MPSSE stream IO sends, so every IO code path,
+including command encoding, runs unchanged without an adapter:
+
+    import nandsim
+    from flashdevice import IO
+    model = nandsim.NandModel(t_r = 50e-6, t_prog = 600e-6, read_bit_error_rate = 1e-4)
+    nand = IO(transport = nandsim.SimulatedFtdi(model))
+
+IO(simulation_mode = True) uses a default NandModel.  Timings are in seconds
+and are real time: a busy chip stays busy on the wall clock, so throughput
+measured against the simulator includes the time the host spends waiting.
+"""
+import math
+import random
+import re
+import struct
+import time
+import flashdevice_defs
+import onfi
+
+ONFI_REVISION_4_0 = 1<<9
+
+# tRC (read cycle time) of asynchronous timing modes 0-5
+ONFI_T_RC = (100e-9, 50e-9, 35e-9, 30e-9, 25e-9, 20e-9)
+
+# commands whose data output comes from NandModel.output rather than the page register
+_OUTPUT_COMMANDS = (flashdevice_defs.NAND_CMD_READID, flashdevice_defs.NAND_CMD_ONFI, flashdevice_defs.NAND_CMD_READ_UNIQUE_ID, flashdevice_defs.NAND_CMD_GET_FEATURES)
+
+class _LunState:
+    """Registers and ready state of one LUN."""
+    __slots__ = ('register', 'cache', 'plane_registers', 'plane_queue', 'column', 'row', 'failed', 'failed_previous', 'busy_until', 'array_busy_until')
+
+    def __init__(self, raw_page_size):
+        self.register = bytearray(b'\xff' * raw_page_size)
+        # data output comes from the cache register, a normal read loads both
+        self.cache = self.register
+        self.plane_registers = {}
+        # rows (and program data) queued by 32h / 11h / D1h for the next confirm
+        self.plane_queue = []
+        self.column = 0
+        self.row = 0
+        self.failed = False
+        self.failed_previous = False
+        self.busy_until = 0.0
+        self.array_busy_until = 0.0
+
+def _lun_field(name):
+    # NandModel attribute that lives in the currently selected LUN
+    return property(lambda self: getattr(self.lun, name), lambda self, value: setattr(self.lun, name, value))
+
+class NandModel:
+    """One ONFI target: geometry, array contents, register file and timing.
+
+    Pages are stored sparsely, erased pages read back as 0xff.  Pages are
+    indexed linearly over the target ('row' below); row addresses on the
+    bus are decoded from their page, block and LUN fields (see
+    page_of_row), so any pages_per_block and blocks_per_lun work and
+    addressing bugs on parts where they are not powers of two show up.
+    With planes > 1 the low block
+    address bits select the plane and the multi-plane commands (32h, 11h,
+    D1h, 06h-E0h) operate on one block per plane for the time of one.
+    Every LUN has its own registers and busy state; the row address of a
+    command, or READ STATUS ENHANCED (78h), selects the LUN it applies to,
+    and R/B# is low while any LUN is busy.  READ UNIQUE ID (EDh) returns
+    unique_id, random per seed when not given.  With read_offset_feature
+    set, the first parameter of that feature is a signed read offset level
+    and every level away from read_offset_optimum adds
+    read_offset_error_rate to the read bit error rate.  timing_modes lists
+    the supported asynchronous timing modes (bit n: mode n); data output is
+    corrupted in modes above max_reliable_timing_mode, and the mode's tRC
+    bounds the rate of SimulatedFtdi.
+    """
+    register = _lun_field('register')
+    cache = _lun_field('cache')
+    plane_registers = _lun_field('plane_registers')
+    plane_queue = _lun_field('plane_queue')
+    column = _lun_field('column')
+    row = _lun_field('row')
+    failed = _lun_field('failed')
+    failed_previous = _lun_field('failed_previous')
+    busy_until = _lun_field('busy_until')
+    array_busy_until = _lun_field('array_busy_until')
+
+    def __init__(self, page_size = 4096, oob_size = 224, pages_per_block = 64, blocks_per_lun = 256, luns = 1, planes = 1,
+                 bits_per_cell = 2, column_cycles = 2, row_cycles = 3, manufacturer = 'MICRON', model = 'SIMULATED NAND',
+                 id_bytes = (0x2c, 0x68, 0x04, 0x4a, 0xa9, 0x00, 0x00, 0x00),
+                 t_r = 0.0, t_prog = 0.0, t_bers = 0.0, t_feat = 0.0, t_rst = 0.0, t_rcbsy = 0.0, t_cbsy = 0.0, t_dbsy = 0.0, t_ccs = 500e-9,
+                 optional_commands = flashdevice_defs.ONFI_OPT_CMD_CACHE_PROGRAM | flashdevice_defs.ONFI_OPT_CMD_READ_CACHE | flashdevice_defs.ONFI_OPT_CMD_GET_SET_FEATURES |
+                                     flashdevice_defs.ONFI_OPT_CMD_READ_STATUS_ENHANCED | flashdevice_defs.ONFI_OPT_CMD_READ_UNIQUE_ID |
+                                     flashdevice_defs.ONFI_OPT_CMD_CHANGE_READ_COLUMN_ENHANCED,
+                 read_bit_error_rate = 0.0, bad_blocks = (), seed = None, unique_id = None,
+                 read_offset_feature = None, read_offset_error_rate = 0.0, read_offset_optimum = 0, timing_modes = 0x1f, max_reliable_timing_mode = None):
+        if planes & (planes - 1) or blocks_per_lun % planes:
+            raise ValueError(f"planes must be a power of two dividing blocks_per_lun, got {planes}")
+
+        self.PageSize = page_size
+        self.OOBSize = oob_size
+        self.RawPageSize = page_size + oob_size
+        self.PagePerBlock = pages_per_block
+        self.BlockPerLUN = blocks_per_lun
+        self.LUNS = luns
+        self.Planes = planes
+        self.PlaneAddressBits = planes.bit_length() - 1
+        self.PageAddressBits = (pages_per_block - 1).bit_length()
+        self.BlockAddressBits = (blocks_per_lun - 1).bit_length()
+        self.BlockCount = blocks_per_lun * luns
+        self.PageCount = self.BlockCount * pages_per_block
+        self.BitsPerCell = bits_per_cell
+        self.ColumnCycles = column_cycles
+        self.RowCycles = row_cycles
+        self.Manufacturer = manufacturer
+        self.Model = model
+        self.IDBytes = bytes(id_bytes)
+        self.OptionalCommands = optional_commands
+
+        self.tR = t_r
+        self.tPROG = t_prog
+        self.tBERS = t_bers
+        self.tFEAT = t_feat
+        self.tRST = t_rst
+        self.tRCBSY = t_rcbsy
+        self.tCBSY = t_cbsy
+        self.tDBSY = t_dbsy
+        self.tCCS = t_ccs
+        self.ReadBitErrorRate = read_bit_error_rate
+        self.ReadOffsetFeature = read_offset_feature
+        self.ReadOffsetErrorRate = read_offset_error_rate
+        self.ReadOffsetOptimum = read_offset_optimum
+        self.TimingModes = timing_modes
+        self.MaxReliableTimingMode = max_reliable_timing_mode
+        self.rng = random.Random(seed)
+        self.UniqueID = bytes(unique_id) if unique_id is not None else bytes(self.rng.getrandbits(8) for _ in range(16))
+
+        self.pages = {}
+        self.bad_blocks = set(bad_blocks)
+        for block in self.bad_blocks:
+            for page in (block * pages_per_block, (block + 1) * pages_per_block - 1):
+                marked = bytearray(b'\xff' * self.RawPageSize)
+                marked[page_size] = 0
+                self.pages[page] = marked
+
+        self.features = {}
+        self.write_protected = True
+        self.counters = {}
+        self.__reset_state()
+
+    def __reset_state(self):
+        self.cmd = None
+        self.addr = []
+        self.output = b''
+        self.output_pos = 0
+        # 00h after a status read returns to the output of ECh/EDh/EEh/90h
+        self.output_resumed = False
+        self.input = None
+        self.luns = [_LunState(self.RawPageSize) for _ in range(self.LUNS)]
+        self.lun = self.luns[0]
+        self.features[0x01] = bytes(4)
+        self.features[0x91] = bytes((1 if self.BitsPerCell == 1 else 2, 1, 0, 0))
+        if self.ReadOffsetFeature is not None:
+            self.features[self.ReadOffsetFeature] = bytes(4)
+
+    # Geometry helpers
+    def block_of(self, row):
+        return row // self.PagePerBlock
+
+    def lun_of(self, row):
+        return min(row // (self.BlockPerLUN * self.PagePerBlock), self.LUNS - 1)
+
+    def __select(self, row):
+        self.lun = self.luns[self.lun_of(row)]
+        return row
+
+    def page_of_row(self, address):
+        """Linear page index of the ONFI row address 'address', PageCount
+        (out of the array) when its page, block or LUN field is out of range.
+        """
+        page = address & ((1 << self.PageAddressBits) - 1)
+        block = (address >> self.PageAddressBits) & ((1 << self.BlockAddressBits) - 1)
+        lun = address >> (self.PageAddressBits + self.BlockAddressBits)
+        if page >= self.PagePerBlock or block >= self.BlockPerLUN or lun >= self.LUNS:
+            return self.PageCount
+        return (lun * self.BlockPerLUN + block) * self.PagePerBlock + page
+
+    def plane_of(self, row):
+        return self.block_of(row) % self.Planes
+
+    def __valid_plane_set(self, rows):
+        # one block per plane, all at the same page offset
+        return len(set(self.plane_of(row) for row in rows)) == len(rows) and len(set(row % self.PagePerBlock for row in rows)) == 1
+
+    def parameter_page(self):
+        """Returns one 256 byte ONFI parameter page, CRC included."""
+        page = bytearray(256)
+        page[0:4] = b'ONFI'
+        features = flashdevice_defs.ONFI_FEATURE_MULTI_LUN if self.LUNS > 1 else 0
+        if self.Planes > 1:
+            features |= flashdevice_defs.ONFI_FEATURE_MULTI_PLANE_PROG_ERASE | flashdevice_defs.ONFI_FEATURE_MULTI_PLANE_READ
+        struct.pack_into('<HH', page, 4, ONFI_REVISION_4_0, features)
+        struct.pack_into('<H', page, 8, self.OptionalCommands)
+        page[14] = 3
+        page[32:44] = self.Manufacturer.encode('ascii')[:12].ljust(12)
+        page[44:64] = self.Model.encode('ascii')[:20].ljust(20)
+        page[64] = self.IDBytes[0]
+        struct.pack_into('<IH', page, 80, self.PageSize, self.OOBSize)
+        struct.pack_into('<IIB', page, 92, self.PagePerBlock, self.BlockPerLUN, self.LUNS)
+        page[101] = (self.ColumnCycles << 4) | self.RowCycles
+        page[102] = self.BitsPerCell
+        struct.pack_into('<HBB', page, 103, max(1, self.BlockPerLUN // 50), 3, 3)
+        page[110] = 1
+        page[112] = 8
+        page[113] = self.PlaneAddressBits
+        struct.pack_into('<H', page, 129, self.TimingModes)
+        struct.pack_into('<HHH', page, 133, *(min(0xffff, max(1, int(math.ceil(t * 1e6)))) for t in (self.tPROG, self.tBERS, self.tR)))
+        # tCCS in ns
+        struct.pack_into('<H', page, 139, int(math.ceil(self.tCCS * 1e9)))
+        struct.pack_into('<H', page, 254, onfi.crc16(page[:254]))
+        return bytes(page)
+
+    def timing_mode(self):
+        return self.features[flashdevice_defs.ONFI_FEATURE_ADDR_TIMING_MODE][0] & 0x0f
+
+    def cycle_time(self):
+        """tRC of the current timing mode, in seconds."""
+        return ONFI_T_RC[min(self.timing_mode(), len(ONFI_T_RC) - 1)]
+
+    # Status
+    def is_ready(self):
+        """R/B#: high once every LUN is ready."""
+        now = time.perf_counter()
+        return all(now >= lun.busy_until for lun in self.luns)
+
+    def status(self):
+        now = time.perf_counter()
+        value = 0
+        if self.failed:
+            value |= flashdevice_defs.NAND_STATUS_FAIL
+        if self.failed_previous:
+            value |= flashdevice_defs.NAND_STATUS_FAILC
+        if now >= self.array_busy_until:
+            value |= flashdevice_defs.NAND_STATUS_IDLE
+        if now >= self.busy_until:
+            value |= flashdevice_defs.NAND_STATUS_READY
+        if not self.write_protected:
+            value |= flashdevice_defs.NAND_STATUS_NOT_PROTECTED
+        return value
+
+    def wait_ready(self):
+        delay = max(lun.busy_until for lun in self.luns) - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def __busy(self, duration, array = True):
+        until = time.perf_counter() + duration
+        self.busy_until = until
+        if array:
+            self.array_busy_until = until
+
+    def __count(self, name):
+        self.counters[name] = self.counters.get(name, 0) + 1
+
+    # Array access
+    def page_data(self, row):
+        """Returns the stored raw page (main + spare) without read noise."""
+        stored = self.pages.get(row)
+        return bytes(stored) if stored is not None else b'\xff' * self.RawPageSize
+
+    def inject_bit_errors(self, row, bit_positions):
+        """Flips the given bit offsets of a stored page until it is erased."""
+        stored = self.pages.setdefault(row, bytearray(b'\xff' * self.RawPageSize))
+        for bit in bit_positions:
+            stored[bit >> 3] ^= 1 << (bit & 7)
+
+    def read_error_rate(self):
+        """Read bit error rate at the current read offset level."""
+        if self.ReadOffsetFeature is None:
+            return self.ReadBitErrorRate
+        level = self.features.get(self.ReadOffsetFeature, bytes(4))[0]
+        level -= 256 if level & 0x80 else 0
+        return min(0.5, self.ReadBitErrorRate + self.ReadOffsetErrorRate * abs(level - self.ReadOffsetOptimum))
+
+    def __sense(self, row):
+        data = bytearray(self.page_data(row))
+        error_rate = self.read_error_rate()
+        if error_rate > 0:
+            # geometric gaps between flipped bits, cheap for small error rates
+            log_keep = math.log1p(-error_rate)
+            bit = -1
+            total = len(data) * 8
+            while True:
+                bit += 1 + int(math.log(1.0 - self.rng.random()) / log_keep)
+                if bit >= total:
+                    break
+                data[bit >> 3] ^= 1 << (bit & 7)
+        return data
+
+    def __program(self, row, data):
+        if self.write_protected or self.block_of(row) in self.bad_blocks or row >= self.PageCount:
+            return False
+        stored = self.pages.get(row)
+        if stored is None:
+            self.pages[row] = bytearray(data)
+        else:
+            # programming can only clear bits
+            stored[:] = (int.from_bytes(stored, 'little') & int.from_bytes(data, 'little')).to_bytes(len(stored), 'little')
+        return True
+
+    def __erase(self, row):
+        block = self.block_of(row)
+        if self.write_protected or block in self.bad_blocks or block >= self.BlockCount:
+            return False
+        first_page = block * self.PagePerBlock
+        for page in range(first_page, first_page + self.PagePerBlock):
+            self.pages.pop(page, None)
+        return True
+
+    def __set_output(self, data):
+        self.output = data
+        self.output_pos = 0
+
+    # Bus cycles
+    def command(self, cmd):
+        self.__count(f"cmd_{cmd:02x}")
+        if cmd == flashdevice_defs.NAND_CMD_RESET:
+            self.__reset_state()
+            self.__busy(self.tRST)
+        elif cmd == flashdevice_defs.NAND_CMD_STATUS:
+            if self.cmd != cmd:
+                self.output_resumed = self.cmd in _OUTPUT_COMMANDS
+            self.cmd = cmd
+        elif cmd == flashdevice_defs.NAND_CMD_STATUS_ENHANCED:
+            self.output_resumed = False
+            self.cmd = cmd
+            self.addr = []
+        elif cmd == flashdevice_defs.NAND_CMD_READSTART and self.cmd == flashdevice_defs.NAND_CMD_READ0:
+            self.__decode_page_address()
+            rows = self.plane_queue + [self.row]
+            self.plane_queue = []
+            self.failed = not self.__valid_plane_set(rows)
+            for row in rows:
+                self.plane_registers[self.plane_of(row)] = self.__sense(row)
+            self.register = self.plane_registers[self.plane_of(self.row)]
+            self.cache = self.register
+            self.cmd = cmd
+            self.__busy(self.tR)
+        elif cmd == flashdevice_defs.NAND_CMD_MULTIPLANE_READ and self.cmd == flashdevice_defs.NAND_CMD_READ0 and self.Planes > 1:
+            self.__decode_page_address()
+            self.plane_queue.append(self.row)
+            self.cmd = None
+            self.__busy(self.tDBSY, array = False)
+        elif cmd == flashdevice_defs.NAND_CMD_MULTIPLANE_PROG and self.cmd == flashdevice_defs.NAND_CMD_SEQIN and self.Planes > 1:
+            self.plane_queue.append((self.row, self.register))
+            self.cmd = None
+            self.__busy(self.tDBSY, array = False)
+        elif cmd == flashdevice_defs.NAND_CMD_MULTIPLANE_ERASE and self.cmd == flashdevice_defs.NAND_CMD_ERASE1 and self.Planes > 1:
+            self.plane_queue.append(self.__select(self.__decode_row(self.addr)))
+            self.cmd = None
+            self.__busy(self.tDBSY, array = False)
+        elif cmd == flashdevice_defs.NAND_CMD_CHANGE_READ_COLUMN2 and self.cmd == flashdevice_defs.NAND_CMD_CHANGE_READ_COLUMN_ENHANCED:
+            self.__decode_page_address()
+            self.cache = self.plane_registers.get(self.plane_of(self.row), self.cache)
+            self.cmd = flashdevice_defs.NAND_CMD_READSTART
+        elif cmd == flashdevice_defs.NAND_CMD_READ_CACHE_SEQ and self.OptionalCommands & flashdevice_defs.ONFI_OPT_CMD_READ_CACHE:
+            # 31h: hand the sensed page to the cache register and sense the next
+            # .. one, either sequential or the one addressed by 00h-address-31h
+            start = max(time.perf_counter(), self.array_busy_until)
+            if self.cmd == flashdevice_defs.NAND_CMD_READ0 and self.addr:
+                self.__decode_page_address()
+            else:
+                self.row += 1
+            self.cache = self.register
+            self.register = self.__sense(self.row)
+            self.column = 0
+            self.cmd = flashdevice_defs.NAND_CMD_READSTART
+            self.busy_until = start + self.tRCBSY
+            self.array_busy_until = start + self.tR
+        elif cmd == flashdevice_defs.NAND_CMD_READ_CACHE_END and self.OptionalCommands & flashdevice_defs.ONFI_OPT_CMD_READ_CACHE:
+            start = max(time.perf_counter(), self.array_busy_until)
+            self.cache = self.register
+            self.column = 0
+            self.cmd = flashdevice_defs.NAND_CMD_READSTART
+            self.busy_until = self.array_busy_until = start + self.tRCBSY
+        elif cmd == flashdevice_defs.NAND_CMD_CHANGE_READ_COLUMN2 and self.cmd == flashdevice_defs.NAND_CMD_CHANGE_READ_COLUMN1:
+            self.column = self.__decode_column()
+            self.cmd = flashdevice_defs.NAND_CMD_READSTART
+        elif cmd in (flashdevice_defs.NAND_CMD_PAGEPROG, flashdevice_defs.NAND_CMD_CACHEDPROG) and self.cmd == flashdevice_defs.NAND_CMD_SEQIN:
+            # a cache program still running in the array delays the next one
+            start = max(time.perf_counter(), self.array_busy_until)
+            self.failed_previous = self.failed
+            queued = self.plane_queue + [(self.row, self.register)]
+            self.plane_queue = []
+            self.failed = not self.__valid_plane_set([row for row, _ in queued])
+            for row, data in queued:
+                self.failed = not self.__program(row, data) or self.failed
+            self.cmd = None
+            self.array_busy_until = start + self.tPROG
+            if cmd == flashdevice_defs.NAND_CMD_CACHEDPROG and self.OptionalCommands & flashdevice_defs.ONFI_OPT_CMD_CACHE_PROGRAM:
+                self.busy_until = start + self.tCBSY
+            else:
+                self.busy_until = self.array_busy_until
+        elif cmd == flashdevice_defs.NAND_CMD_ERASE2 and self.cmd == flashdevice_defs.NAND_CMD_ERASE1:
+            rows = [self.__select(self.__decode_row(self.addr))]
+            rows = self.plane_queue + rows
+            self.plane_queue = []
+            self.failed = len(set(self.plane_of(row) for row in rows)) != len(rows)
+            for row in rows:
+                self.failed = not self.__erase(row) or self.failed
+            self.cmd = None
+            self.__busy(self.tBERS)
+        else:
+            if cmd == flashdevice_defs.NAND_CMD_CHANGE_READ_COLUMN1 and self.cmd == flashdevice_defs.NAND_CMD_READ0 and len(self.addr) == self.ColumnCycles + self.RowCycles:
+                # 00h-address-05h: select the plane to output from
+                self.cache = self.plane_registers.get(self.plane_of(self.__decode_row(self.addr[self.ColumnCycles:])), self.cache)
+            self.cmd = cmd
+            self.addr = []
+
+    def address(self, addr):
+        self.addr.append(addr)
+        if self.cmd == flashdevice_defs.NAND_CMD_READID and len(self.addr) == 1:
+            self.__set_output(b'ONFI' if addr == 0x20 else self.IDBytes)
+        elif self.cmd == flashdevice_defs.NAND_CMD_ONFI and len(self.addr) == 1:
+            self.__set_output(self.parameter_page() * 3)
+            self.__busy(self.tR, array = False)
+        elif self.cmd == flashdevice_defs.NAND_CMD_READ_UNIQUE_ID and len(self.addr) == 1 and self.OptionalCommands & flashdevice_defs.ONFI_OPT_CMD_READ_UNIQUE_ID:
+            # 16 copies of the ID followed by its complement
+            self.__set_output((self.UniqueID + bytes(b ^ 0xff for b in self.UniqueID)) * 16)
+            self.__busy(self.tR, array = False)
+        elif self.cmd == flashdevice_defs.NAND_CMD_GET_FEATURES and len(self.addr) == 1:
+            self.__set_output(self.features.get(addr, bytes(4)))
+            self.__busy(self.tFEAT, array = False)
+        elif self.cmd == flashdevice_defs.NAND_CMD_SEQIN and len(self.addr) == self.ColumnCycles + self.RowCycles:
+            self.__decode_page_address()
+            self.register = bytearray(b'\xff' * self.RawPageSize)
+        elif self.cmd == flashdevice_defs.NAND_CMD_STATUS_ENHANCED and len(self.addr) == self.RowCycles:
+            # 78h: status of the addressed LUN, which also becomes the one for data output
+            self.__select(self.__decode_row(self.addr))
+            self.cmd = flashdevice_defs.NAND_CMD_STATUS
+
+    def write(self, data):
+        if self.cmd == flashdevice_defs.NAND_CMD_SEQIN:
+            end = self.column + len(data)
+            self.register[self.column:end] = data[:max(0, self.RawPageSize - self.column)]
+            self.column = end
+        elif self.cmd == flashdevice_defs.NAND_CMD_SET_FEATURES and self.addr:
+            self.input = (self.input or b'') + bytes(data)
+            if len(self.input) >= 4:
+                if self.addr[0] != flashdevice_defs.ONFI_FEATURE_ADDR_TIMING_MODE or self.TimingModes & (1 << (self.input[0] & 0x0f)):
+                    self.features[self.addr[0]] = self.input[:4]
+                self.input = None
+                self.cmd = None
+                self.__busy(self.tFEAT, array = False)
+
+    def read(self, count):
+        data = self.__read(count)
+        if self.MaxReliableTimingMode is not None and self.timing_mode() > self.MaxReliableTimingMode:
+            # the host samples too early for this mode: bit 0 comes out wrong
+            data = bytes(each_byte ^ 1 for each_byte in data)
+        return data
+
+    def __read(self, count):
+        if self.cmd == flashdevice_defs.NAND_CMD_STATUS:
+            return bytes((self.status(),)) * count
+        if time.perf_counter() < self.busy_until:
+            # data output while busy returns garbage on real parts
+            return bytes(count)
+        # 00h without an address returns to data output after a status read
+        if self.cmd == flashdevice_defs.NAND_CMD_READSTART or (self.cmd == flashdevice_defs.NAND_CMD_READ0 and not self.addr and not self.output_resumed):
+            data = bytes(self.cache[self.column:self.column + count])
+            self.column += count
+        else:
+            data = self.output[self.output_pos:self.output_pos + count]
+            self.output_pos += count
+        return data.ljust(count, b'\x00')
+
+    def __decode_column(self):
+        column = 0
+        for idx in range(min(len(self.addr), self.ColumnCycles)):
+            column |= self.addr[idx] << (8 * idx)
+        return column
+
+    def __decode_row(self, cycles):
+        address = 0
+        for idx, addr in enumerate(cycles[:self.RowCycles]):
+            address |= addr << (8 * idx)
+        return self.page_of_row(address)
+
+    def __decode_page_address(self):
+        row = self.__select(self.__decode_row(self.addr[self.ColumnCycles:]))
+        self.column = self.__decode_column()
+        self.row = row
+
+_READ_RUN = re.compile(b'(?:\\x90\\x00)+')
+_WRITE_RUN = re.compile(b'(?:\\x92\\x00.)+', re.DOTALL)
+
+class SimulatedFtdi:
+    """Decodes MPSSE MCU host bus commands and drives a NandModel.
+
+    latency adds a fixed delay per write_data/read_data_bytes call and
+    bytes_per_second bounds the bus rate, so USB round trips cost time the
+    way they do on an FT2232H.  Both default to free.
+    """
+    BITMODE_MCU = 0x08
+    LATENCY_MIN = 1
+
+    def __init__(self, model = None, latency = 0.0, bytes_per_second = 0.0):
+        self.model = model if model is not None else NandModel()
+        self.latency = latency
+        self.bytes_per_second = bytes_per_second
+        self.is_connected = True
+        self.clk_div5 = False
+        self.address_high = 0
+        self.gpio_high = 0
+        self.rx = bytearray()
+        self.writes = 0
+        self.reads = 0
+
+    def set_bitmode(self, bitmask, mode):
+        return
+
+    def set_latency_timer(self, latency):
+        return
+
+    def purge_buffers(self):
+        self.rx = bytearray()
+
+    def close(self):
+        self.is_connected = False
+
+    # bytes_per_second applies at 60 MHz, the divided clock is five times slower, and
+    # .. neither can be faster than the chip's tRC
+    def __delay(self, nbytes):
+        delay = self.latency
+        if self.bytes_per_second:
+            delay += nbytes * max((5 if self.clk_div5 else 1) / self.bytes_per_second, self.model.cycle_time())
+        if delay > 0:
+            time.sleep(delay)
+
+    def __latch(self, address_high):
+        self.address_high = address_high
+        self.model.write_protected = not address_high & flashdevice_defs.ADR_WP
+
+    def __output(self, data, bus = True):
+        if bus and self.clk_div5:
+            # the divided clock returns every byte twice, IO keeps the even ones
+            data = bytes(b for each_byte in data for b in (each_byte, each_byte))
+        self.rx += data
+
+    def __bus_write(self, data):
+        if self.address_high & flashdevice_defs.ADR_CL:
+            for each_byte in data:
+                self.model.command(each_byte)
+        elif self.address_high & flashdevice_defs.ADR_AL:
+            for each_byte in data:
+                self.model.address(each_byte)
+        else:
+            self.model.write(data)
+
+    def write_data(self, data):
+        data = bytes(data)
+        self.writes += 1
+        self.__delay(len(data))
+        pos = 0
+        length = len(data)
+        while pos < length:
+            opcode = data[pos]
+            if opcode == flashdevice_defs.MPSSE_READ_EXTENDED:
+                self.__latch(data[pos + 1])
+                self.__output(self.model.read(1))
+                pos += 3
+            elif opcode == flashdevice_defs.MPSSE_READ_SHORT:
+                run = _READ_RUN.match(data, pos)
+                self.__output(self.model.read((run.end() - pos) // 2))
+                pos = run.end()
+            elif opcode == flashdevice_defs.MPSSE_WRITE_EXTENDED:
+                self.__latch(data[pos + 1])
+                self.__bus_write(data[pos + 3:pos + 4])
+                pos += 4
+            elif opcode == flashdevice_defs.MPSSE_WRITE_SHORT:
+                run = _WRITE_RUN.match(data, pos)
+                self.__bus_write(data[pos + 2:run.end():3])
+                pos = run.end()
+            elif opcode == flashdevice_defs.MPSSE_SET_BITS_HIGH:
+                self.gpio_high = data[pos + 1]
+                pos += 3
+            elif opcode == flashdevice_defs.MPSSE_GET_BITS_HIGH:
+                self.__output(bytes(((self.gpio_high & ~0x2) | (0x2 if self.model.is_ready() else 0),)), bus = False)
+                pos += 1
+            elif opcode == flashdevice_defs.MPSSE_WAIT_ON_HIGH:
+                # R/B# wired to I/O1
+                self.model.wait_ready()
+                pos += 1
+            elif opcode in (flashdevice_defs.MPSSE_ENABLE_CLK_DIV5, flashdevice_defs.MPSSE_DISABLE_CLK_DIV5):
+                self.clk_div5 = opcode == flashdevice_defs.MPSSE_ENABLE_CLK_DIV5
+                pos += 1
+            elif opcode == flashdevice_defs.MPSSE_SEND_IMMEDIATE:
+                pos += 1
+            else:
+                raise ValueError(f"Unsupported MPSSE opcode 0x{opcode:02x} at offset {pos}")
+        return length
+
+    def read_data_bytes(self, size, attempt = 1):
+        self.reads += 1
+        self.__delay(size)
+        data = bytes(self.rx[:size])
+        del self.rx[:size]
+        return data
@@ -0,0 +1,163 @@
+# pylint: disable=invalid-name
+# pylint: disable=line-too-long
+"""ONFI parameter page decoding (ONFI 4.0, 5.7.1).
+
+ParameterPage.from_copies takes the redundant copies as read after ECh,
+uses the first one whose CRC-16 matches, and falls back to a bitwise
+majority vote over the copies when none does.  Decoded pages are cached on
+disk (see load_cached/store_cached) by JEDEC ID, and by unique ID for
+chips whose page differs from others of the same JEDEC ID, so a reconnect
+does not have to read the parameter page again.  The timing mode that
+passed transfer verification is kept next to it (load_timing_modes/
+store_timing_modes).
+"""
+import json
+import os
+import struct
+
+PARAMETER_PAGE_SIZE = 256
+SIGNATURE = b'ONFI'
+
+def _crc_table():
+    table = []
+    for value in range(256):
+        crc = value << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x8005 if crc & 0x8000 else crc << 1) & 0xffff
+        table.append(crc)
+    return table
+
+_CRC_TABLE = _crc_table()
+
+def crc16(data):
+    """CRC-16 of the parameter page: polynomial 0x8005, initial value 0x4F4E, no reflection."""
+    crc = 0x4F4E
+    for each_byte in data:
+        crc = ((crc << 8) & 0xffff) ^ _CRC_TABLE[(crc >> 8) ^ each_byte]
+    return crc
+
+def _ascii(data):
+    return bytes(data).decode('ascii', 'replace')
+
+def _endurance(data, offset):
+    # value and decimal exponent, e.g. 3, 3 for 3000 cycles
+    return data[offset] * 10 ** data[offset + 1]
+
+class ParameterPage:
+    """Decoded ONFI parameter page; t_*_max and t_ccs_min are in seconds."""
+    __slots__ = ('raw', 'crc_valid', 'revision', 'features', 'optional_commands', 'manufacturer', 'model', 'jedec_id', 'date_code',
+                 'page_size', 'oob_size', 'pages_per_block', 'blocks_per_lun', 'luns', 'column_cycles', 'row_cycles', 'bits_per_cell',
+                 'max_bad_blocks_per_lun', 'block_endurance', 'guaranteed_blocks', 'guaranteed_block_endurance', 'programs_per_page',
+                 'ecc_bits', 'plane_address_bits', 'multi_plane_attributes', 'io_capacitance', 'timing_modes', 'program_cache_timing_modes',
+                 't_prog_max', 't_bers_max', 't_r_max', 't_ccs_min', 'vendor_revision')
+
+    def __init__(self, raw, crc_valid = True):
+        data = bytes(raw[:PARAMETER_PAGE_SIZE])
+        self.raw = data
+        self.crc_valid = crc_valid
+        self.revision, self.features, self.optional_commands = struct.unpack_from('<HHH', data, 4)
+        self.manufacturer = _ascii(data[32:44])
+        self.model = _ascii(data[44:64])
+        self.jedec_id = data[64]
+        self.date_code = struct.unpack_from('<H', data, 65)[0]
+        self.page_size, self.oob_size = struct.unpack_from('<IH', data, 80)
+        self.pages_per_block, self.blocks_per_lun, self.luns = struct.unpack_from('<IIB', data, 92)
+        self.column_cycles = data[101] >> 4
+        self.row_cycles = data[101] & 0x0f
+        self.bits_per_cell = data[102]
+        self.max_bad_blocks_per_lun = struct.unpack_from('<H', data, 103)[0]
+        self.block_endurance = _endurance(data, 105)
+        self.guaranteed_blocks = data[107]
+        self.guaranteed_block_endurance = _endurance(data, 108)
+        self.programs_per_page = data[110]
+        self.ecc_bits = data[112]
+        self.plane_address_bits = data[113] & 0x0f
+        self.multi_plane_attributes = data[114]
+        self.io_capacitance = data[128]
+        self.timing_modes, self.program_cache_timing_modes = struct.unpack_from('<HH', data, 129)
+        t_prog, t_bers, t_r, t_ccs = struct.unpack_from('<HHHH', data, 133)
+        self.t_prog_max = t_prog / 1e6
+        self.t_bers_max = t_bers / 1e6
+        self.t_r_max = t_r / 1e6
+        # tCCS is given in ns
+        self.t_ccs_min = t_ccs / 1e9
+        self.vendor_revision = struct.unpack_from('<H', data, 164)[0]
+
+    @property
+    def planes(self):
+        return 1 << self.plane_address_bits
+
+    @classmethod
+    def from_copies(cls, data):
+        """Decodes the first copy with a valid signature and CRC out of the
+        redundant copies in 'data'.  Without one, the copies are combined by
+        a bitwise majority vote; returns None if even that has no signature.
+        """
+        data = bytes(data)
+        copies = [data[offset:offset + PARAMETER_PAGE_SIZE] for offset in range(0, len(data) - PARAMETER_PAGE_SIZE + 1, PARAMETER_PAGE_SIZE)]
+        for copy in copies:
+            if copy[:4] == SIGNATURE and crc16(copy[:254]) == struct.unpack_from('<H', copy, 254)[0]:
+                return cls(copy)
+
+        if not copies:
+            return None
+        voted = bytes(sum(1 << bit for bit in range(8) if sum((copy[idx] >> bit) & 1 for copy in copies) * 2 > len(copies))
+                      for idx in range(PARAMETER_PAGE_SIZE))
+        if voted[:4] != SIGNATURE:
+            return None
+        return cls(voted, crc16(voted[:254]) == struct.unpack_from('<H', voted, 254)[0])
+
+def cache_path(directory, jedec_id, unique_id = None, extension = '.bin'):
+    name = bytes(jedec_id).hex() + ('_' + unique_id if unique_id else '')
+    return os.path.join(directory, name + extension)
+
+def load_cached(directory, jedec_id, unique_id = None):
+    """Returns the cached ParameterPage for this chip, or None."""
+    path = cache_path(directory, jedec_id, unique_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as fd:
+        page = ParameterPage.from_copies(fd.read())
+    return page if page is not None and page.crc_valid else None
+
+def load_cached_entries(directory, jedec_id):
+    """Returns every cached ParameterPage of this JEDEC ID by unique ID, None
+    for the one stored without a unique ID.
+    """
+    prefix = bytes(jedec_id).hex()
+    if not os.path.isdir(directory):
+        return {}
+    entries = {}
+    for name in sorted(os.listdir(directory)):
+        stem, extension = os.path.splitext(name)
+        if extension != '.bin' or not (stem == prefix or stem.startswith(prefix + '_')):
+            continue
+        unique_id = stem[len(prefix) + 1:] or None
+        page = load_cached(directory, jedec_id, unique_id)
+        if page is not None:
+            entries[unique_id] = page
+    return entries
+
+def store_cached(directory, page, jedec_id, unique_id = None):
+    if not page.crc_valid:
+        return
+    os.makedirs(directory, exist_ok = True)
+    path = cache_path(directory, jedec_id, unique_id)
+    with open(path + '.tmp', 'wb') as fd:
+        fd.write(page.raw)
+    os.replace(path + '.tmp', path)
+
+def load_timing_modes(directory, jedec_id):
+    """Returns the timing mode records stored for this JEDEC ID (see IO.select_timing_mode)."""
+    path = cache_path(directory, jedec_id, extension = '.json')
+    if not os.path.exists(path):
+        return []
+    with open(path) as fd:
+        return json.load(fd)
+
+def store_timing_modes(directory, jedec_id, records):
+    os.makedirs(directory, exist_ok = True)
+    path = cache_path(directory, jedec_id, extension = '.json')
+    with open(path + '.tmp', 'w') as fd:
+        json.dump(records, fd)
+    os.replace(path + '.tmp', path)
@@ -0,0 +1,58 @@
+# pylint: disable=invalid-name
+# pylint: disable=line-too-long
+"""Plots of measurement results.
+
+matplotlib is only imported by the first plot.  In headless mode it gets the
+non-interactive Agg backend and plots are saved to files instead of shown;
+headless is the default when ONFI_HEADLESS=1 or when there is no display.
+"""
+import os
+import sys
+
+def _no_display():
+    if sys.platform.startswith('linux'):
+        return not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY')
+    return False
+
+HEADLESS = os.environ.get('ONFI_HEADLESS', '') not in ('', '0') or _no_display()
+
+def pyplot(headless = None):
+    """Returns matplotlib.pyplot, selecting the Agg backend when headless."""
+    import matplotlib
+    if HEADLESS if headless is None else headless:
+        matplotlib.use('Agg')
+    from matplotlib import pyplot as plt
+    return plt
+
+def read_page_ber(report_path, block_idx, page_count):
+    """Returns (pages, ber) of the latest page_count entries for block_idx in
+    a <IDString>_BER.txt report (block,page,ber lines).
+    """
+    import csv
+    with open(report_path, 'r') as error_data:
+        rows = [row for row in csv.reader(error_data, delimiter = ",") if int(row[0]) == block_idx][-page_count:]
+    return [int(row[1]) for row in rows], [float(row[2]) for row in rows]
+
+def plot_page_ber(report_path, block_idx, page_count, output = None, headless = None):
+    """Plots the bit error rate per page of one block from a BER report.
+
+    Shows the plot, or when headless saves it to 'output' (by default next to
+    the report, <report>_block<N>.png) and returns that path.
+    """
+    headless = HEADLESS if headless is None else headless
+    pages, page_ber = read_page_ber(report_path, block_idx, page_count)
+
+    plt = pyplot(headless)
+    plt.figure()
+    plt.plot(pages, page_ber)
+    plt.xlabel("Page")
+    plt.ylabel("Bit Error Rate")
+    plt.title("BER per Page")
+    if not headless:
+        plt.show()
+        return None
+
+    output = output or f"{os.path.splitext(report_path)[0]}_block{block_idx}.png"
+    plt.savefig(output)
+    plt.close()
+    return output
@@ -0,0 +1,169 @@
+# pylint: disable=invalid-name
+# pylint: disable=line-too-long
+"""Append-only columnar store for per-page measurements.
+
+A store is a directory with one raw binary file per column (NumPy dtypes
+below), a string table for chips and patterns, and an index with one entry
+per appended batch (chip, block, cycle range, first row, row count).
+Queries scan the small index, then slice memory-mapped columns, so reading
+"all pages of block 12 across cycles 0-3000" out of months of data touches
+only those rows:
+
+    store = ResultStore('results')
+    store.append_block(chip, 12, cycle, 'random', page_bits, bits_per_page)
+    rows = store.select(block = 12, cycles = (0, 3000))
+    rows['cycle'], rows['page'], rows['bits']
+"""
+import json
+import os
+import time
+import numpy as np
+
+COLUMNS = (('chip', np.uint16), ('block', np.uint32), ('page', np.uint32), ('cycle', np.uint32), ('pattern', np.uint16),
+           ('bits', np.uint32), ('bits_compared', np.uint32), ('time', np.float64))
+
+INDEX_DTYPE = np.dtype([('chip', np.uint16), ('block', np.uint32), ('cycle_min', np.uint32), ('cycle_max', np.uint32),
+                        ('row_start', np.uint64), ('row_count', np.uint32)])
+
+def chip_name(nand):
+    """Store key of the chip behind an IO: model and unique ID when known."""
+    unique_id = nand.get_unique_id() if hasattr(nand, 'get_unique_id') else getattr(nand, 'UniqueID', None)
+    return nand.IDString.rstrip() + (f" {unique_id}" if unique_id else '')
+
+class ResultStore:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok = True)
+        self.tables = {'chips': [], 'patterns': []}
+        tables_path = os.path.join(path, 'tables.json')
+        if os.path.exists(tables_path):
+            with open(tables_path) as fd:
+                self.tables = json.load(fd)
+        self.rows = self.__repair()
+
+    def __column_path(self, name):
+        return os.path.join(self.path, name + '.bin')
+
+    def __index_path(self):
+        return os.path.join(self.path, 'index.bin')
+
+    # An interrupted append can leave columns of different lengths: cut them
+    # .. back to the rows the index fully covers
+    def __repair(self):
+        index = self.index()
+        rows = min((os.path.getsize(self.__column_path(name)) // np.dtype(dtype).itemsize if os.path.exists(self.__column_path(name)) else 0)
+                   for name, dtype in COLUMNS)
+        complete = index['row_start'] + index['row_count'] <= rows
+        if not complete.all():
+            index = index[complete]
+            with open(self.__index_path(), 'wb') as fd:
+                index.tofile(fd)
+        rows = int((index['row_start'] + index['row_count']).max()) if len(index) else 0
+        for name, dtype in COLUMNS:
+            if os.path.exists(self.__column_path(name)) and os.path.getsize(self.__column_path(name)) != rows * np.dtype(dtype).itemsize:
+                with open(self.__column_path(name), 'r+b') as fd:
+                    fd.truncate(rows * np.dtype(dtype).itemsize)
+        return rows
+
+    def truncate(self, rows):
+        """Drops every row from 'rows' on, e.g. the ones appended after a checkpoint."""
+        index = self.index()
+        with open(self.__index_path(), 'wb') as fd:
+            index[index['row_start'] + index['row_count'] <= rows].tofile(fd)
+        self.rows = self.__repair()
+
+    def __key(self, table, name):
+        names = self.tables[table]
+        if name not in names:
+            names.append(name)
+            with open(os.path.join(self.path, 'tables.json.tmp'), 'w') as fd:
+                json.dump(self.tables, fd)
+            os.replace(os.path.join(self.path, 'tables.json.tmp'), os.path.join(self.path, 'tables.json'))
+        return names.index(name)
+
+    def append(self, chip, block, cycle, pattern, pages, bits, bits_compared):
+        """Appends one batch of rows of one chip and block: pages, bits and
+        bits_compared are per row (bits_compared may be a single value),
+        cycle a single value or one per row.
+        """
+        pages = np.asarray(pages, dtype = np.uint32)
+        count = len(pages)
+        if not count:
+            return
+        cycles = np.broadcast_to(np.asarray(cycle, dtype = np.uint32), (count,))
+        columns = {'chip': np.full(count, self.__key('chips', chip), dtype = np.uint16),
+                   'block': np.full(count, block, dtype = np.uint32),
+                   'page': pages,
+                   'cycle': cycles,
+                   'pattern': np.full(count, self.__key('patterns', pattern), dtype = np.uint16),
+                   'bits': np.asarray(bits, dtype = np.uint32),
+                   'bits_compared': np.broadcast_to(np.asarray(bits_compared, dtype = np.uint32), (count,)),
+                   'time': np.full(count, time.time(), dtype = np.float64)}
+        for name, dtype in COLUMNS:
+            with open(self.__column_path(name), 'ab') as fd:
+                np.ascontiguousarray(columns[name], dtype = dtype).tofile(fd)
+
+        # the index entry goes last, it is what makes the rows visible
+        entry = np.array([(columns['chip'][0], block, cycles.min(), cycles.max(), self.rows, count)], dtype = INDEX_DTYPE)
+        with open(self.__index_path(), 'ab') as fd:
+            entry.tofile(fd)
+        self.rows += count
+
+    def append_block(self, chip, block, cycle, pattern, page_bits, bits_compared):
+        """Appends one read of a whole block, page_bits[i] being page i."""
+        self.append(chip, block, cycle, pattern, np.arange(len(page_bits)), page_bits, bits_compared)
+
+    def index(self):
+        if not os.path.exists(self.__index_path()):
+            return np.zeros(0, dtype = INDEX_DTYPE)
+        return np.fromfile(self.__index_path(), dtype = INDEX_DTYPE)
+
+    def column(self, name):
+        """Memory-mapped column 'name' over all rows."""
+        dtype = dict(COLUMNS)[name]
+        if not self.rows:
+            return np.zeros(0, dtype = dtype)
+        return np.memmap(self.__column_path(name), dtype = dtype, mode = 'r', shape = (self.rows,))
+
+    def select(self, chip = None, block = None, cycles = None, pattern = None, columns = None):
+        """Returns {column: array} of the rows matching every given key.
+
+        block may be one block or a list, cycles an inclusive (first, last)
+        range.  chip and pattern are names as passed to append.
+        """
+        index = self.index()
+        mask = np.ones(len(index), dtype = bool)
+        if chip is not None:
+            mask &= index['chip'] == self.tables['chips'].index(chip) if chip in self.tables['chips'] else False
+        if pattern is not None and pattern not in self.tables['patterns']:
+            mask[:] = False
+        if block is not None:
+            mask &= np.isin(index['block'], np.atleast_1d(block))
+        if cycles is not None:
+            mask &= (index['cycle_max'] >= cycles[0]) & (index['cycle_min'] <= cycles[1])
+        entries = index[mask]
+        starts = entries['row_start'].astype(np.int64)
+        counts = entries['row_count'].astype(np.int64)
+        # row numbers of every selected batch, without a Python loop over batches
+        rows = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum(), dtype = np.int64)
+
+        names = [name for name, _ in COLUMNS] if columns is None else list(columns)
+        for name in ('cycle', 'pattern'):
+            if name not in names:
+                names.append(name)
+        result = {name: np.asarray(self.column(name)[rows]) for name in names}
+
+        # batches can span cycles and patterns, filter the rows themselves
+        keep = np.ones(len(rows), dtype = bool)
+        if cycles is not None:
+            keep &= (result['cycle'] >= cycles[0]) & (result['cycle'] <= cycles[1])
+        if pattern is not None and len(rows):
+            keep &= result['pattern'] == self.tables['patterns'].index(pattern)
+        if not keep.all():
+            result = {name: values[keep] for name, values in result.items()}
+        return result
+
+    def names(self, table, keys):
+        """Maps 'chip' or 'pattern' column values back to their names."""
+        names = self.tables[table + 's']
+        return [names[key] for key in keys]
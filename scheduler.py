@@ -0,0 +1,102 @@
+# pylint: disable=invalid-name
+# pylint: disable=line-too-long
+"""LUN-interleaved operation scheduler.
+
+Reads, programs and erases are queued per LUN.  run() issues the next
+operation of every idle LUN while the others are still busy and tracks
+completion per LUN with READ STATUS ENHANCED (78h), so a package with N
+LUNs keeps N array operations in flight.  Parts with one LUN, or without
+78h, run the same queues one operation at a time.
+
+    sched = LunScheduler(nand)
+    tickets = [sched.read(pageno) for pageno in pages]
+    results = sched.run()          # ticket -> page data / status byte
+"""
+import time
+from collections import deque
+import flashdevice_defs
+
+READ = 'read'
+PROGRAM = 'program'
+ERASE = 'erase'
+
+class LunScheduler:
+    def __init__(self, nand):
+        self.nand = nand
+        self.queues = [deque() for _ in range(max(1, nand.LUNS))]
+        self.next_ticket = 0
+
+    def interleaved(self):
+        return len(self.queues) > 1 and self.nand.supports_status_enhanced()
+
+    def __enqueue(self, kind, pageno, payload = None):
+        ticket = self.next_ticket
+        self.next_ticket += 1
+        self.queues[self.nand.lun_of(pageno)].append((ticket, kind, pageno, payload))
+        return ticket
+
+    # Each of these queues one operation and returns its ticket for run()
+    # .. read: column/length select part of the page, e.g. only the spare area
+    def read(self, pageno, remove_oob = False, column = 0, length = None):
+        if length is None:
+            length = (self.nand.PageSize if remove_oob else self.nand.RawPageSize) - column
+        return self.__enqueue(READ, pageno, (column, length))
+
+    def program(self, pageno, data):
+        return self.__enqueue(PROGRAM, pageno, data)
+
+    def erase(self, blockno):
+        return self.__enqueue(ERASE, blockno * self.nand.PagePerBlock)
+
+    def pending(self):
+        return sum(len(queue) for queue in self.queues)
+
+    def __start(self, kind, pageno, payload):
+        if kind == READ:
+            self.nand.start_read(pageno, payload[0])
+        elif kind == PROGRAM:
+            self.nand.start_program(pageno, payload)
+        else:
+            self.nand.start_erase(pageno)
+
+    # Runs every queued operation. Returns a dict mapping each ticket to the page
+    # .. data (read) or the status byte (program, erase)
+    def run(self):
+        results = {}
+        # LUN -> (ticket, kind, pageno, payload, deadline)
+        active = {}
+        in_flight = len(self.queues) if self.interleaved() else 1
+        interval = self.nand.MaxPollInterval / 64
+
+        try:
+            while active or self.pending():
+                for lun, queue in enumerate(self.queues):
+                    if len(active) >= in_flight:
+                        break
+                    if lun not in active and queue:
+                        ticket, kind, pageno, payload = queue.popleft()
+                        self.__start(kind, pageno, payload)
+                        active[lun] = (ticket, kind, pageno, payload, time.perf_counter() + self.nand.ReadyTimeout)
+
+                luns = list(active)
+                statuses = self.nand.lun_status([active[lun][2] for lun in luns])
+                completed = False
+                for lun, status in zip(luns, statuses):
+                    ticket, kind, pageno, payload, deadline = active[lun]
+                    if not status & flashdevice_defs.NAND_STATUS_READY:
+                        if time.perf_counter() > deadline:
+                            raise TimeoutError('LUN %d still busy after %.3f s' % (lun, self.nand.ReadyTimeout))
+                        continue
+                    del active[lun]
+                    completed = True
+                    results[ticket] = self.nand.read_lun_data(pageno, payload[1]) if kind == READ else status
+
+                if completed:
+                    interval = self.nand.MaxPollInterval / 64
+                else:
+                    time.sleep(interval)
+                    interval = min(interval * 2, self.nand.MaxPollInterval)
+        finally:
+            self.nand.WriteProtect = True
+
+        return results
@@ -1,4 +1,5 @@
 import numpy as np
+import ber
 
 # finds the number of 1s in the number input
 # ..  the algo iscalled Brain-Kernigham algo
@@ -30,34 +31,18 @@ def write_to_file(output_file,page_data, write_binary = False):
 		fd.write(print_str)
 		fd.close()
 
-def compute_ber(file1,is_file1_binary,file2,is_file2_binary):
-	# let us read file 1 first
-	data1 = []
-	data2 = []
-	if is_file1_binary:
-		fd1 = open(file1,'rb')
-		data1 = fd1.read()
-		fd1.close()
-	else:
-		# add other conditions later
-		return -1
-
-	if is_file2_binary:
-		fd2 = open(file2,'rb')
-		data2 = fd2.read()
-		fd2.close()
-	else:
+def compute_ber(file1,is_file1_binary,file2,is_file2_binary,page_size = None):
+	# compares two binary files with ber.compare (memory-mapped, vectorized)
+	# .. and returns its BerResult; page_size adds per-page/per-column counts
+	if not is_file1_binary or not is_file2_binary:
 		# add other conditions later
 		return -1
 
-	number_of_bits_mismatch = 0.0
-	number_of_bytes_mismatch = 0.0
-	for idx,each_byte in enumerate(data1):
-		if(each_byte!=data2[idx]):
-			number_of_bytes_mismatch += 1
-			number_of_bits_mismatch += count_number_of_1s(each_byte^data2[idx])
-
-	print(f"I: BER comparing {file1} and {file2} is Bytes: {number_of_bytes_mismatch}/{len(data1)}, Bits: {number_of_bits_mismatch}/{len(data1)*8}")
+	result = ber.compare(file1, file2, page_size)
+	print(f"I: BER comparing {file1} and {file2} is Bytes: {result.bytes}/{result.bytes_compared}, Bits: {result.bits}/{result.bits_compared}")
+	if result.length_difference:
+		print(f"I: {file1} and {file2} differ in length, the last {result.length_difference} bytes were not compared")
+	return result
 
 def create_array(array_pattern, array_size, filename=""):
 	'''Creates numpy array with values following specified pattern, optionally writing it to a file if a filename is specified.'''
@@ -0,0 +1,103 @@
+# pylint: disable=invalid-name
+# pylint: disable=line-too-long
+"""Read reference voltage sweeps.
+
+VthSweep steps a vendor read retry / read offset feature register through a
+list of levels and reads the same pages at every level, one batched
+IO.read_pages_with_feature call per level.  Every read is compared with the
+expected data (by default the read at the default level), giving the bit
+flips per level and page.  How the count of bits read as 1 changes from one
+level to the next estimates the threshold voltage distribution:
+
+    sweep = VthSweep(nand, 0x89, range(-64, 64))
+    result = sweep.run(range(block * nand.PagePerBlock, (block + 1) * nand.PagePerBlock))
+    result.bits.sum(axis = 1)      # bit flips per level
+    result.distribution()          # cells per step between adjacent levels
+
+Levels become the four feature parameters through 'encode', by default the
+level as a signed byte in P1 (Micron read retry 89h, many vendors' read
+offset registers).  The default parameters are written back afterwards.
+"""
+import numpy as np
+import ber
+
+def signed_p1(level):
+    return (level & 0xff, 0, 0, 0)
+
+class SweepResult:
+    """Per level (rows) and page (columns) counts of one sweep.
+
+    bits: bits differing from the expected data, split by direction into
+    flips_0_to_1 and flips_1_to_0.  ones: bits read as 1.
+    """
+    __slots__ = ('levels', 'pages', 'bits_per_page', 'bits', 'flips_0_to_1', 'flips_1_to_0', 'ones')
+
+    def __init__(self, levels, pages, bits_per_page):
+        self.levels = list(levels)
+        self.pages = list(pages)
+        self.bits_per_page = bits_per_page
+        shape = (len(self.levels), len(self.pages))
+        self.bits = np.zeros(shape, dtype = np.int64)
+        self.flips_0_to_1 = np.zeros(shape, dtype = np.int64)
+        self.flips_1_to_0 = np.zeros(shape, dtype = np.int64)
+        self.ones = np.zeros(shape, dtype = np.int64)
+
+    @property
+    def ber(self):
+        """Bit error rate per level over all pages."""
+        return self.bits.sum(axis = 1) / (len(self.pages) * self.bits_per_page) if self.pages else np.zeros(len(self.levels))
+
+    def distribution(self):
+        """Cells whose threshold voltage lies between adjacent levels, for levels
+        in increasing read voltage order: the drop of the bits read as 1.
+        """
+        return -np.diff(self.ones.sum(axis = 1))
+
+    def best_level(self):
+        """Level with the fewest bit flips."""
+        return self.levels[int(self.bits.sum(axis = 1).argmin())]
+
+    def save(self, path):
+        np.savez(path, levels = np.array(self.levels), pages = np.array(self.pages), bits_per_page = self.bits_per_page,
+                 bits = self.bits, flips_0_to_1 = self.flips_0_to_1, flips_1_to_0 = self.flips_1_to_0, ones = self.ones)
+
+class VthSweep:
+    def __init__(self, nand, feature_address, levels, encode = signed_p1, default = (0, 0, 0, 0), remove_oob = True, batch = 16):
+        self.nand = nand
+        self.feature_address = feature_address
+        self.levels = list(levels)
+        self.encode = encode
+        self.default = default
+        self.remove_oob = remove_oob
+        self.batch = batch
+
+    def read(self, values, pagenos):
+        return self.nand.read_pages_with_feature(self.feature_address, values, pagenos, self.remove_oob, self.batch)
+
+    def run(self, pagenos, expected = None):
+        """Sweeps every level over 'pagenos' and returns a SweepResult.
+
+        expected is one buffer per page (e.g. the programmed pattern); by
+        default the pages as read at the default level.
+        """
+        pagenos = list(pagenos)
+        length = self.nand.PageSize if self.remove_oob else self.nand.RawPageSize
+        if expected is None:
+            expected = self.read(self.default, pagenos)
+        expected = [ber.as_array(page)[:length] for page in expected]
+        result = SweepResult(self.levels, pagenos, length * 8)
+
+        try:
+            for level_idx, level in enumerate(self.levels):
+                for page_idx, data in enumerate(self.read(self.encode(level), pagenos)):
+                    actual = ber.as_array(data)[:length]
+                    reference = expected[page_idx][:len(actual)]
+                    diff = reference ^ actual
+                    result.bits[level_idx, page_idx] = ber.popcount(diff).sum(dtype = np.int64)
+                    result.flips_0_to_1[level_idx, page_idx] = ber.popcount(diff & actual).sum(dtype = np.int64)
+                    result.flips_1_to_0[level_idx, page_idx] = ber.popcount(diff & reference).sum(dtype = np.int64)
+                    result.ones[level_idx, page_idx] = ber.popcount(actual).sum(dtype = np.int64)
+        finally:
+            self.read(self.default, [])
+
+        return result